@@ -0,0 +1,321 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from charts import figure_png
+from geo_cache import BASEMAP_PATH, clear_cache
+from helper import DataAnalysis, GeoAnalysis
+from loader import COMPACT_COLUMNS, compact_frame, load_all_data, load_order_batch, memory_report
+from rollup import RollupCube
+from store import TimeIndexedStore
+from streaming import StreamingAnalysis, write_partitioned
+
+METHODS = {
+    'sum_revenue': 'create_sum_revenue_df',
+    'sum_spend': 'create_sum_spend_df',
+    'count_product': 'create_count_product_df',
+    'revenue_by_month_year': 'create_revenue_by_month_year_df',
+    'mean_delivery_time': 'create_mean_delivery_time_df',
+    'mean_estimated_diff': 'create_mean_estimated_diff_df',
+    'review': 'create_review_df',
+    'rfm': 'create_rfm_df',
+}
+
+CATEGORIES = ['bed_bath_table', 'health_beauty', 'sports_leisure', 'furniture_decor', 'computers_accessories',
+              'housewares', 'watches_gifts', 'telephony', 'garden_tools', 'auto', 'toys', 'cool_stuff',
+              'perfumery', 'baby', 'electronics', 'stationery', 'fashion_bags_accessories', 'pet_shop',
+              'office_furniture', 'consoles_games', 'luggage_accessories', 'construction_tools_construction',
+              'home_appliances', 'musical_instruments', 'small_appliances', 'books_general_interest', 'food',
+              'drinks', 'art', 'flowers', 'security_and_services']
+
+# rough centre of each Brazilian state, used to scatter synthetic geolocations
+STATES = {
+    'SP': (-23.5, -46.6), 'RJ': (-22.9, -43.2), 'MG': (-19.9, -43.9), 'RS': (-30.0, -51.2), 'PR': (-25.4, -49.3),
+    'SC': (-27.6, -48.5), 'BA': (-12.9, -38.5), 'DF': (-15.8, -47.9), 'ES': (-20.3, -40.3), 'GO': (-16.7, -49.3),
+    'PE': (-8.0, -34.9), 'CE': (-3.7, -38.5), 'PA': (-1.5, -48.5), 'MT': (-15.6, -56.1), 'MA': (-2.5, -44.3),
+    'MS': (-20.5, -54.6), 'PB': (-7.1, -34.9), 'PI': (-5.1, -42.8), 'RN': (-5.8, -35.2), 'AL': (-9.7, -35.7),
+    'SE': (-10.9, -37.1), 'TO': (-10.2, -48.3), 'RO': (-8.8, -63.9), 'AM': (-3.1, -60.0), 'AC': (-9.97, -67.8),
+    'AP': (0.03, -51.1), 'RR': (2.8, -60.7),
+}
+
+
+# below the streaming default so the larger runs span several chunks
+STREAM_CHUNK = 100000
+
+# the part of main.py that runs before the first metric is drawn, in a fresh interpreter so imports count
+FIRST_PAINT = '''
+import json, sys, time
+start = time.perf_counter()
+from helper import DataAnalysis, GeoAnalysis
+from refresh import order_feed
+from report import load_report
+from shared import shared_geo
+feed = order_feed(sys.argv[1])
+store, rollup = feed.snapshot()
+window = store.slice(store.min_time, store.max_time)
+results = DataAnalysis(window, rollup=rollup.window(store.min_time, store.max_time),
+                       reference_date=store.column_max('order_estimated_delivery_date')).compute_all()
+results['revenue_by_month_year'].order_count.sum()
+first_paint = time.perf_counter() - start
+preloaded = [name for name in ('matplotlib', 'seaborn', 'geopandas', 'shapely') if name in sys.modules]
+import charts
+print(json.dumps({'first_paint_s': first_paint, 'charts_import_s': time.perf_counter() - start - first_paint,
+                  'preloaded': preloaded}))
+'''
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _hex_ids(rng, n):
+    raw = rng.bytes(16 * n)
+    return [raw[i:i + 16].hex() for i in range(0, 16 * n, 16)]
+
+
+def make_orders(n, seed=0, start='2016-09-01', days=730):
+    rng = np.random.default_rng(seed)
+    n_customers = max(n * 9 // 10, 1)
+    n_sellers = max(n // 30, 1)
+    customers = pd.Categorical(_hex_ids(rng, n_customers))
+    sellers = pd.Categorical(_hex_ids(rng, n_sellers))
+
+    purchase = pd.Timestamp(start).to_datetime64() + np.sort(rng.integers(0, days * 86400, n)).astype('timedelta64[s]')
+    approved = purchase + rng.integers(600, 2 * 86400, n).astype('timedelta64[s]')
+    carrier = approved + rng.integers(86400, 5 * 86400, n).astype('timedelta64[s]')
+    delivered = carrier + rng.integers(86400, 20 * 86400, n).astype('timedelta64[s]')
+    estimated = purchase + rng.integers(10, 40, n).astype('timedelta64[D]')
+    undelivered = rng.random(n) < 0.03
+    delivered = np.where(undelivered, np.datetime64('NaT'), delivered)
+
+    payment = np.round(rng.lognormal(4.5, 0.9, n), 2)
+    states = list(STATES)
+    state_weights = np.linspace(2.0, 0.1, len(states))
+    state_weights /= state_weights.sum()
+
+    df = pd.DataFrame({
+        'order_id': pd.Categorical(_hex_ids(rng, n)),
+        'customer_id': customers.take(rng.integers(0, n_customers, n)),
+        'seller_id': sellers.take(rng.zipf(1.6, n) % n_sellers),
+        'product_category_name_english': pd.Categorical.from_codes(rng.integers(0, len(CATEGORIES), n), CATEGORIES),
+        'customer_state': pd.Categorical.from_codes(rng.choice(len(states), n, p=state_weights), states),
+        'seller_state': pd.Categorical.from_codes(rng.choice(len(states), n, p=state_weights), states),
+        'review_score': rng.choice([1, 2, 3, 4, 5], n, p=[0.11, 0.03, 0.08, 0.19, 0.59]),
+        'payment_value_y': payment,
+        'total_spend': payment,
+        'order_purchase_timestamp': purchase.astype('datetime64[ns]'),
+        'order_approved_at': approved.astype('datetime64[ns]'),
+        'order_delivered_carrier_date': carrier.astype('datetime64[ns]'),
+        'order_delivered_customer_date': delivered.astype('datetime64[ns]'),
+        'order_estimated_delivery_date': estimated.astype('datetime64[ns]'),
+    })
+    return df
+
+
+def make_geo(n, id_column, seed=0):
+    rng = np.random.default_rng(seed)
+    states = list(STATES)
+    codes = rng.integers(0, len(states), n)
+    centres = np.array([STATES[state] for state in states])
+    return pd.DataFrame({
+        id_column: pd.Categorical(_hex_ids(rng, n)),
+        'geolocation_zip_code_prefix': rng.integers(1000, 99999, n).astype('int32'),
+        'geolocation_city': pd.Categorical.from_codes(codes, [state.lower() for state in states]),
+        'geolocation_state': pd.Categorical.from_codes(codes, states),
+        'geolocation_lat': centres[codes, 0] + rng.normal(0, 1.5, n),
+        'geolocation_lng': centres[codes, 1] + rng.normal(0, 1.5, n),
+    })
+
+
+def measure(func, repeat=3):
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {'wall_s': min(timings), 'peak_mb': peak / 2 ** 20}, result
+
+
+def _first_paint_run(path, cwd):
+    env = dict(os.environ, PYTHONPATH=HERE)
+    output = subprocess.run([sys.executable, '-c', FIRST_PAINT, os.path.abspath(path)], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_first_paint(path, repeat=3):
+    # the first run parses the CSV and writes the snapshots, later runs start from them like a restarted server
+    with tempfile.TemporaryDirectory() as tmp:
+        cold = _first_paint_run(path, tmp)
+        warm = [_first_paint_run(path, tmp) for _ in range(repeat)]
+    return {
+        'startup.first_paint_cold': {'wall_s': cold['first_paint_s'], 'preloaded': cold['preloaded']},
+        'startup.first_paint_warm': {'wall_s': min(run['first_paint_s'] for run in warm)},
+        'startup.import_charts': {'wall_s': min(run['charts_import_s'] for run in warm)},
+    }
+
+
+def run_method_by_method(df):
+    helper_func = DataAnalysis(df)
+    return {name: getattr(helper_func, method)() for name, method in METHODS.items()}
+
+
+def run_fused(df):
+    return DataAnalysis(df).compute_all()
+
+
+def frames_match(left, right):
+    # grouped id columns come back as plain strings on some paths, compare them by value
+    left = left.astype({col: str for col in left.columns if isinstance(left[col].dtype, pd.CategoricalDtype)})
+    right = right.astype({col: str for col in right.columns if isinstance(right[col].dtype, pd.CategoricalDtype)})
+    left = left.sort_values(list(left.columns)).reset_index(drop=True)
+    right = right.sort_values(list(right.columns)).reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(left, right, check_dtype=False, check_categorical=False)
+    except AssertionError:
+        return False
+    return True
+
+
+def compare_fused(df, repeat=5):
+    separate, expected = measure(lambda: run_method_by_method(df), repeat)
+    fused, actual = measure(lambda: run_fused(df), repeat)
+    mismatched = [name for name in METHODS if name != 'rfm' and not frames_match(expected[name], actual[name])]
+    return {
+        'rows': len(df),
+        'method_by_method_s': separate['wall_s'],
+        'compute_all_s': fused['wall_s'],
+        'speedup': separate['wall_s'] / fused['wall_s'] if fused['wall_s'] else float('inf'),
+        'mismatched': mismatched,
+    }
+
+
+def bench_rows(n, repeat=3, geo=True, seed=0):
+    results = {}
+    orders = make_orders(n, seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'orders.csv')
+        orders.to_csv(path, index=False)
+        results['load.read_csv'], _ = measure(lambda: pd.read_csv(path), repeat)
+        results['load.typed'], _ = measure(lambda: load_order_batch(path), repeat)
+        results['load.compact'], compact = measure(
+            lambda: compact_frame(load_order_batch(path, usecols=COMPACT_COLUMNS)), repeat)
+        results['load.compact']['frame_mb'] = memory_report(compact)['total_mb']
+        # peak_mb here against load.compact is the memory the chunked backend saves
+        parts = os.path.join(tmp, 'orders')
+        write_partitioned(compact, parts)
+        results['streaming.csv'], _ = measure(
+            lambda: StreamingAnalysis(path, chunksize=STREAM_CHUNK).compute_all(), repeat)
+        results['streaming.parquet'], _ = measure(
+            lambda: StreamingAnalysis(parts, chunksize=STREAM_CHUNK).compute_all(), repeat)
+        results.update(bench_first_paint(path, repeat))
+
+    start = orders['order_purchase_timestamp'].iloc[len(orders) // 4].date()
+    end = orders['order_purchase_timestamp'].iloc[3 * len(orders) // 4].date()
+    results['filter.string_mask'], _ = measure(
+        lambda: orders[(orders['order_purchase_timestamp'] >= str(start)) &
+                       (orders['order_purchase_timestamp'] <= str(end))], repeat)
+    results['filter.store_build'], store = measure(lambda: TimeIndexedStore(orders), repeat)
+    results['filter.searchsorted'], window = measure(lambda: store.slice(start, end), repeat)
+
+    helper_func = DataAnalysis(window)
+    for name, method in METHODS.items():
+        results[f'analysis.{method}'], _ = measure(getattr(helper_func, method), repeat)
+    results['analysis.compute_all'], _ = measure(helper_func.compute_all, repeat)
+
+    results['rollup.build'], cube = measure(lambda: RollupCube.from_orders(orders), repeat)
+    batch = make_orders(200, seed + 1)
+    results['store.append'], _ = measure(lambda: store.append(batch), repeat)
+    results['rollup.append'], _ = measure(lambda: cube.append(batch), repeat)
+    rollup_func = DataAnalysis(window, rollup=cube.window(start, end))
+    results['rollup.compute_all'], _ = measure(rollup_func.compute_all, repeat)
+
+    if geo:
+        results.update(bench_geo(n, repeat, seed))
+    return results
+
+
+def bench_geo(n, repeat=3, seed=0):
+    if not os.path.exists(BASEMAP_PATH):
+        return {}
+    plot_func = GeoAnalysis(make_geo(n, 'customer_id', seed), make_geo(max(n // 30, 1), 'seller_id', seed + 1))
+    results = {}
+    for name, figure in [('customer', plot_func.customer_geolocation_figure), ('seller', plot_func.seller_geolocation_figure)]:
+        def render():
+            clear_cache()
+            return figure_png(figure())
+        results[f'geo.plot_{name}_geolocation'], _ = measure(render, repeat)
+    return results
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    regressions = []
+    for rows, results in report['results'].items():
+        for name, current in results.items():
+            previous = baseline.get('results', {}).get(rows, {}).get(name)
+            if previous and current['wall_s'] > previous['wall_s'] * (1 + tolerance):
+                regressions.append({
+                    'rows': rows,
+                    'name': name,
+                    'baseline_s': previous['wall_s'],
+                    'current_s': current['wall_s'],
+                })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard pipeline on synthetic orders.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='previous results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before flagging, 0.2 = 20%%')
+    parser.add_argument('--no-geo', action='store_true', help='skip the geolocation plots')
+    parser.add_argument('--data', help='also compare compute_all against the per-method path on this CSV')
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'python': sys.version.split()[0],
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+    for n in args.rows:
+        print(f'benchmarking {n} rows...', flush=True)
+        report['results'][str(n)] = bench_rows(n, args.repeat, geo=not args.no_geo)
+    if args.data:
+        report['fused'] = compare_fused(load_all_data(args.data), args.repeat)
+        report['startup'] = bench_first_paint(args.data, args.repeat)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION {rows} rows {name}: {baseline_s:.4f}s -> {current_s:.4f}s'.format(**regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+import seaborn as sns
+from instrument import capture, merge_records, timed
+
+sns.set(style='dark')
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+_frame_digests = OrderedDict()
+
+
+def frame_digest(frame):
+    # long-lived frames (the geo tables) are hashed once; the entry holds the frame so its id stays unique
+    cached = _frame_digests.get(id(frame))
+    if cached is not None and cached[0] is frame:
+        return cached[1]
+    sha = hashlib.sha1(repr(list(frame.columns)).encode())
+    sha.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    digest = sha.hexdigest()
+    if len(frame) >= 10000:
+        _frame_digests[id(frame)] = (frame, digest)
+        while len(_frame_digests) > 8:
+            _frame_digests.popitem(last=False)
+    return digest
+
+
+def aggregate_hash(*frames):
+    return hashlib.sha1(''.join(frame_digest(frame) for frame in frames).encode()).hexdigest()
+
+
+def new_figure(nrows=1, ncols=1, figsize=(35, 15)):
+    # figures are built outside pyplot's global registry so renders can run on worker threads
+    fig = Figure(figsize=figsize)
+    return fig, fig.subplots(nrows=nrows, ncols=ncols)
+
+
+def figure_png(fig, dpi=100):
+    try:
+        buffer = BytesIO()
+        fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
+
+
+class ChartCache:
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chart_id, frames, render):
+        with timed(f'chart.{chart_id}', sum(len(frame) for frame in frames)) as record:
+            return self._get(chart_id, frames, render, record)
+
+    def _get(self, chart_id, frames, render, record):
+        key = (chart_id, aggregate_hash(*frames))
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                record['cache_hit'] = True
+                return self._images[key]
+        record['cache_hit'] = False
+        png = figure_png(render())
+        with self._lock:
+            self._images[key] = png
+            self._images.move_to_end(key)
+            while len(self._images) > self.maxsize:
+                self._images.popitem(last=False)
+        return png
+
+    def render_all(self, jobs, workers=None):
+        render = capture(lambda job: self.get(*job))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(render, jobs))
+        merge_records(record for _, job_records in outcomes for record in job_records)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+
+
+chart_cache = ChartCache()
+
+
+def top_bottom_frames(df, label_col, value_col, truncate=10):
+    top = df[[label_col, value_col]].head(5)
+    bottom = df[[label_col, value_col]].tail(5).iloc[::-1]
+    frames = []
+    for frame in (top, bottom):
+        labels = frame[label_col].astype(str)
+        if truncate:
+            labels = labels.str[:truncate]
+        frames.append(pd.DataFrame({label_col: labels.to_numpy(), value_col: frame[value_col].to_numpy()}))
+    return frames[0], frames[1]
+
+
+def _bar_panel(ax, frame, label_col, value_col, highlight, color, title, xlabel, ylabel,
+               text_size=30, rotation=0, text_below=False):
+    values = frame[value_col]
+    target = values.max() if highlight == 'max' else values.min()
+    palette = ['silver' if v != target else color for v in values]
+    sns.barplot(x=frame[label_col], y=values, palette=palette, ax=ax)
+    for i, v in enumerate(values):
+        if v == target:
+            if text_below:
+                ax.text(i, v-1, str(v), ha='center', va='top', fontsize=text_size, color=color)
+            else:
+                ax.text(i, v, str(v), ha='center', va='bottom', fontsize=text_size, color=color)
+
+    ax.set_xlabel(xlabel, fontsize=30)
+    ax.set_ylabel(ylabel, fontsize=30)
+    ax.set_title(title, fontsize=50, pad=30)
+    ax.tick_params(axis='y', labelsize=30)
+    ax.tick_params(axis='x', labelsize=30, labelrotation=rotation)
+
+
+def render_top_bottom(top, bottom, label_col, value_col, titles, xlabel, ylabel,
+                      highlight=('max', 'min'), text_size=30, rotation=0, low_text_below=False):
+    fig, ax = new_figure(nrows=1, ncols=2)
+    _bar_panel(ax[0], top, label_col, value_col, highlight[0], 'cornflowerblue', titles[0], xlabel, ylabel,
+               text_size=text_size, rotation=rotation)
+    _bar_panel(ax[1], bottom, label_col, value_col, highlight[1], 'firebrick', titles[1], xlabel, ylabel,
+               text_size=text_size, rotation=rotation, text_below=low_text_below)
+    return fig
+
+
+def render_bars(frame, label_col, value_col, title, xlabel, ylabel, order=None, rotation=0):
+    fig, ax = new_figure()
+    values = frame[value_col]
+    max_value = values.max()
+    palette = ['silver' if v != max_value else 'cornflowerblue' for v in values]
+    sns.barplot(x=frame[label_col], y=values, palette=palette, order=order, ax=ax)
+    for i, v in enumerate(values):
+        if v == max_value:
+            ax.text(i, v, str(v), ha='center', va='bottom', fontsize=30, color='cornflowerblue')
+
+    ax.set_xlabel(xlabel, fontsize=30)
+    ax.set_ylabel(ylabel, fontsize=30)
+    ax.set_title(title, fontsize=50, pad=30)
+    ax.tick_params(axis='x', labelrotation=rotation)
+    ax.tick_params(axis='y', labelsize=30)
+    ax.tick_params(axis='x', labelsize=30)
+    return fig
+
+
+def month_labels(revenue_by_month_year_df):
+    return [f'{MONTHS[i-1]} {j}' for i, j in zip(revenue_by_month_year_df['month'], revenue_by_month_year_df['year'])]
+
+
+def render_monthly_revenue(revenue_by_month_year_df):
+    fig, ax = new_figure()
+    sns.lineplot(x=month_labels(revenue_by_month_year_df), y=revenue_by_month_year_df["revenue"],
+                 marker="o", linewidth=3, color='cornflowerblue', ax=ax)
+    ax.tick_params(axis='x', labelrotation=60, labelsize=30)
+    ax.set_title('Revenue by Month', fontsize=50, pad=30)
+    ax.set_ylabel('Revenue', fontsize=30)
+    ax.set_xlabel('Month', fontsize=30)
+    return fig
+
+
+# chart id -> (result name, label column, value column, label truncation, render options)
+TOP_BOTTOM_CHARTS = {
+    'seller_revenue': ('sum_revenue', 'seller_id', 'revenue', 10,
+                       dict(titles=('Highest Revenue', 'Lowest Revenue'), xlabel='Seller Id', ylabel='Revenue', text_size=25)),
+    'customer_spend': ('sum_spend', 'customer_id', 'total_spend', 10,
+                       dict(titles=('Highest Customer Spend', 'Lowest Customer Spend'), xlabel='Customer Id', ylabel='Spend')),
+    'product_count': ('count_product', 'product_category_name_english', 'product_count', None,
+                      dict(titles=('Most Popular Product', 'Most Unpopular Product'), xlabel='Product category',
+                           ylabel='Total sold', rotation=15)),
+    'delivery_time': ('mean_delivery_time', 'seller_id', 'day_difference', 10,
+                      dict(titles=('Most Responsive Seller', 'Most Unresponsive Seller'), xlabel='Seller Id',
+                           ylabel='Day difference', highlight=('min', 'max'))),
+    'estimated_diff': ('mean_estimated_diff', 'seller_id', 'day_estimated_difference', 10,
+                       dict(titles=('Fastest Package Delivary Than Estimated', 'Slowest Package Delivary Than Estimated'),
+                            xlabel='Seller Id', ylabel='Day difference', low_text_below=True)),
+}
+
+
+def top_bottom_for(results, chart_id):
+    name, label_col, value_col, truncate, _ = TOP_BOTTOM_CHARTS[chart_id]
+    return top_bottom_frames(results[name], label_col, value_col, truncate)
+
+
+def rfm_frames(results):
+    cust_df, segment_product_df = results['rfm']
+    segment_counts = cust_df['value_segment'].value_counts().reset_index()
+    segment_counts.columns = ['value_segment', 'count']
+    segment_labels = pd.DataFrame({
+        'segment': [f'{i}-{j}' for i, j in zip(segment_product_df['value_segment'], segment_product_df['RFM_customer_segments'])],
+        'count': segment_product_df['count'].to_numpy()
+    })
+    return segment_counts, segment_labels
+
+
+def _top_bottom_job(results, chart_id):
+    _, label_col, value_col, _, spec = TOP_BOTTOM_CHARTS[chart_id]
+    top, bottom = top_bottom_for(results, chart_id)
+    return [top, bottom], lambda: render_top_bottom(top, bottom, label_col, value_col, **spec)
+
+
+def chart_jobs(results, top_bottom=True):
+    revenue_by_month_year_df = results['revenue_by_month_year']
+    review_df = results['review']
+    segment_counts, segment_labels = rfm_frames(results)
+    jobs = {
+        'monthly_revenue': ([revenue_by_month_year_df], lambda: render_monthly_revenue(revenue_by_month_year_df)),
+        'review': ([review_df], lambda: render_bars(review_df, 'review_score', 'rating_count', 'Customer Satisfaction Rating',
+                                                    'Rating', 'Customer count', order=review_df.review_score)),
+        'rfm_value_segment': ([segment_counts], lambda: render_bars(segment_counts, 'value_segment', 'count',
+                                                                    'Customer Category Based On RFM Value', 'Category',
+                                                                    'Customer count')),
+        'rfm_segment': ([segment_labels], lambda: render_bars(segment_labels, 'segment', 'count',
+                                                              'Customer Category Based On RFM Score', 'Category',
+                                                              'Customer count', rotation=15)),
+    }
+    if top_bottom:
+        jobs.update({chart_id: _top_bottom_job(results, chart_id) for chart_id in TOP_BOTTOM_CHARTS})
+    return jobs
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+def grid_bins(df, bounds, gridsize=200):
+    minx, miny, maxx, maxy = bounds
+    counts, xedges, yedges = np.histogram2d(
+        df['geolocation_lng'].to_numpy(), df['geolocation_lat'].to_numpy(),
+        bins=gridsize, range=[[minx, maxx], [miny, maxy]]
+    )
+    # histogram2d is indexed [x, y]; pcolormesh wants rows of y
+    return xedges, yedges, np.ma.masked_equal(counts.T, 0)
+
+
+def hex_bins(df, bounds, gridsize=200):
+    # same lattice as Axes.hexbin, so the returned centers land exactly on its cells
+    minx, miny, maxx, maxy = bounds
+    nx = gridsize
+    ny = int(nx / np.sqrt(3))
+    sx = (maxx - minx) / nx
+    sy = (maxy - miny) / ny
+    ix = (df['geolocation_lng'].to_numpy() - minx) / sx
+    iy = (df['geolocation_lat'].to_numpy() - miny) / sy
+    ix1 = np.round(ix)
+    iy1 = np.round(iy)
+    ix2 = np.floor(ix) + 0.5
+    iy2 = np.floor(iy) + 0.5
+    nearest_first = (ix - ix1) ** 2 + 3.0 * (iy - iy1) ** 2 < (ix - ix2) ** 2 + 3.0 * (iy - iy2) ** 2
+    cx = np.where(nearest_first, ix1, ix2)
+    cy = np.where(nearest_first, iy1, iy2)
+    cells, counts = np.unique(np.column_stack([cx, cy]), axis=0, return_counts=True)
+    return minx + cells[:, 0] * sx, miny + cells[:, 1] * sy, counts
+
+
+def state_bins(df):
+    return df.groupby('geolocation_state', observed=True).agg(
+        geolocation_lng=('geolocation_lng', 'mean'),
+        geolocation_lat=('geolocation_lat', 'mean'),
+        count=('geolocation_lat', 'size')
+    ).reset_index()
+
+
+def zip_prefix_bins(df):
+    return df.groupby('geolocation_zip_code_prefix', observed=True).agg(
+        geolocation_lng=('geolocation_lng', 'mean'),
+        geolocation_lat=('geolocation_lat', 'mean'),
+        count=('geolocation_lat', 'size')
+    ).reset_index()
+
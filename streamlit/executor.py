@@ -0,0 +1,102 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from helper import DataAnalysis
+from loader import decode_keys
+from rfm import RFMEngine, customer_partials
+
+# below this many rows (or with a single worker) shipping the window costs more than grouping it here
+PARALLEL_MIN_ROWS = 200000
+
+_pool = None
+_workers = None
+_lock = threading.Lock()
+
+
+def process_pool(workers=None):
+    global _pool, _workers
+    workers = workers or os.cpu_count() or 1
+    with _lock:
+        if _pool is None or _workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn, not fork: the Streamlit server is multi-threaded and forking it is unsafe
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _workers = workers
+        return _pool, _workers
+
+
+@atexit.register
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def customer_payloads(df, n):
+    # only the columns customer_partials and the spend sum read, as plain arrays keyed by customer code;
+    # the category table stays in this process and is applied once to the merged result
+    values = df['customer_id']
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, categories = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, categories = pd.factorize(values)
+    columns = {
+        'customer_id': codes,
+        'order_delivered_customer_date': df['order_delivered_customer_date'].to_numpy(),
+        'order_estimated_delivery_date': df['order_estimated_delivery_date'].to_numpy(),
+        # customer_partials only counts non-missing order ids
+        'order_id': np.where(df['order_id'].notna().to_numpy(), 1.0, np.nan),
+        'payment_value_y': df['payment_value_y'].to_numpy(),
+        'total_spend': df['total_spend'].to_numpy(),
+    }
+    known = codes >= 0
+    bucket = pd.util.hash_array(codes) % n
+    payloads = [{col: values[known & (bucket == i)] for col, values in columns.items()} for i in range(n)]
+    return payloads, categories
+
+
+def _customer_partials(payload):
+    part = pd.DataFrame(payload)
+    spend = part.groupby('customer_id')['total_spend'].sum().reset_index()
+    return customer_partials(part), spend
+
+
+LOCAL_METHODS = {
+    'sum_revenue': 'create_sum_revenue_df',
+    'count_product': 'create_count_product_df',
+    'revenue_by_month_year': 'create_revenue_by_month_year_df',
+    'mean_delivery_time': 'create_mean_delivery_time_df',
+    'mean_estimated_diff': 'create_mean_estimated_diff_df',
+    'review': 'create_review_df',
+}
+
+
+def _merge_customers(parts, categories, reference_date=None):
+    partials, spends = zip(*parts)
+    # each customer lands in exactly one partition, so the partials are already final
+    partial = decode_keys(pd.concat(partials, ignore_index=True), {'customer_id': categories})
+    spend = decode_keys(pd.concat(spends, ignore_index=True), {'customer_id': categories})
+    # the score bins are quantiles over all customers, so scoring happens once on the merged partials
+    return spend.sort_values('total_spend', ascending=False), RFMEngine(reference_date).score(partial)
+
+
+def compute_all_parallel(df, rollup=None, reference_date=None, workers=None):
+    local = DataAnalysis(df, rollup=rollup, reference_date=reference_date)
+    if len(df) < PARALLEL_MIN_ROWS or (workers or os.cpu_count() or 1) < 2:
+        return local.compute_all()
+    pool, n = process_pool(workers)
+    # the per-customer work is the only part that grows with the window: it goes to the workers
+    # while the seller/category/month/review tables are built here
+    payloads, categories = customer_payloads(df, n)
+    futures = [pool.submit(_customer_partials, payload) for payload in payloads]
+    results = {name: getattr(local, method)() for name, method in LOCAL_METHODS.items()}
+    spend, rfm = _merge_customers([future.result() for future in futures], categories, reference_date)
+    # same key order as compute_all
+    return {'sum_revenue': results.pop('sum_revenue'), 'sum_spend': spend, **results, 'rfm': rfm}
@@ -0,0 +1,82 @@
+import threading
+from instrument import timed
+from density import grid_bins, hex_bins, state_bins, zip_prefix_bins
+
+BASEMAP_PATH = './data/ne_10m_admin_0_countries.shp'
+BASEMAP_COLUMNS = ['ADMIN', 'NAME', 'ISO_A3', 'geometry']
+
+_basemaps = {}
+_points = {}
+_densities = {}
+_lock = threading.Lock()
+
+
+def data_bounds(*frames, pad=1.0):
+    minx = min(frame['geolocation_lng'].min() for frame in frames)
+    miny = min(frame['geolocation_lat'].min() for frame in frames)
+    maxx = max(frame['geolocation_lng'].max() for frame in frames)
+    maxy = max(frame['geolocation_lat'].max() for frame in frames)
+    return (minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+
+def load_basemap(bounds, pixels=3500, path=None):
+    path = path or BASEMAP_PATH
+    bounds = tuple(round(float(v), 2) for v in bounds)
+    key = (path, bounds, pixels)
+    with _lock:
+        cached = _basemaps.get(key)
+        if cached is not None:
+            return cached
+        import geopandas as gpd
+        from shapely.geometry import box
+
+        # read only the countries touching the data, clip them to it and drop detail finer than a pixel
+        with timed('geo.read_basemap') as record:
+            world = gpd.read_file(path, bbox=bounds)
+            record['rows'] = len(world)
+        world = world[[col for col in BASEMAP_COLUMNS if col in world.columns]]
+        basemap = world.clip(box(*bounds))
+        tolerance = (bounds[2] - bounds[0]) / pixels
+        basemap = basemap.set_geometry(basemap.geometry.simplify(tolerance, preserve_topology=True))
+        _basemaps[key] = basemap
+        return basemap
+
+
+def point_layer(df):
+    with _lock:
+        cached = _points.get(id(df))
+        # holding the frame keeps its id from being reused while the entry lives
+        if cached is not None and cached[0] is df:
+            return cached[1]
+        import geopandas as gpd
+
+        points = gpd.GeoSeries.from_xy(df['geolocation_lng'], df['geolocation_lat'], crs='EPSG:4326')
+        _points[id(df)] = (df, points)
+        return points
+
+
+def density_layer(df, mode, bounds=None, gridsize=200):
+    key = (id(df), mode, bounds, gridsize)
+    with _lock:
+        cached = _densities.get(key)
+        if cached is not None and cached[0] is df:
+            return cached[1]
+        if mode == 'grid':
+            layer = grid_bins(df, bounds, gridsize)
+        elif mode == 'hex':
+            layer = hex_bins(df, bounds, gridsize)
+        elif mode == 'state':
+            layer = state_bins(df)
+        elif mode == 'zip':
+            layer = zip_prefix_bins(df)
+        else:
+            raise ValueError(f'unknown density mode: {mode}')
+        _densities[key] = (df, layer)
+        return layer
+
+
+def clear_cache():
+    with _lock:
+        _basemaps.clear()
+        _points.clear()
+        _densities.clear()
@@ -1,33 +1,55 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import streamlit as st
+from instrument import instrumented
+from loader import code_keys, decode_keys
+from rfm import RFMEngine, customer_partials
+from geo_cache import data_bounds, density_layer, load_basemap, point_layer
+from regions import choropleth_layer, default_level, region_counts
+
+
+def sum_spend(df):
+    rows, categories = code_keys(df[['customer_id', 'total_spend']], ['customer_id'])
+    spend = decode_keys(rows.groupby('customer_id')['total_spend'].sum().reset_index(), categories)
+    return spend.sort_values('total_spend', ascending=False)
+
 
 class DataAnalysis:
-    def __init__(self, df):
+    def __init__(self, df, rollup=None, reference_date=None):
         self.df = df
+        self.rollup = rollup
+        self.reference_date = reference_date
 
+    @instrumented()
     def create_sum_revenue_df(self):
-        sorted_sum_revenue = self.df.groupby('seller_id').sum(numeric_only=True)[['payment_value_y']].reset_index().sort_values('payment_value_y', ascending=False)
+        if self.rollup is not None:
+            return self.rollup.create_sum_revenue_df()
+        sorted_sum_revenue = self.df.groupby('seller_id', observed=True).sum(numeric_only=True)[['payment_value_y']].reset_index().sort_values('payment_value_y', ascending=False)
         sorted_sum_revenue.rename(columns={
             'payment_value_y': 'revenue'
         }, inplace=True)
         return sorted_sum_revenue
     
+    @instrumented()
     def create_sum_spend_df(self):
-        sorted_sum_spend = self.df.groupby('customer_id').sum(numeric_only=True)[['total_spend']].reset_index().sort_values('total_spend', ascending=False)
-        return sorted_sum_spend
+        if self.rollup is not None:
+            return self.rollup.create_sum_spend_df()
+        return sum_spend(self.df)
     
+    @instrumented()
     def create_count_product_df(self):
-        sorted_count_prod = self.df.groupby('product_category_name_english').count()[['order_id']].reset_index().sort_values('order_id', ascending=False)
+        if self.rollup is not None:
+            return self.rollup.create_count_product_df()
+        sorted_count_prod = self.df.groupby('product_category_name_english', observed=True).count()[['order_id']].reset_index().sort_values('order_id', ascending=False)
         sorted_count_prod.rename(columns={
             'order_id': 'product_count'
         }, inplace=True)
         return sorted_count_prod
     
+    @instrumented()
     def create_revenue_by_month_year_df(self):
+        if self.rollup is not None:
+            return self.rollup.create_revenue_by_month_year_df()
         revenue_by_month = self.df.dropna(subset='order_delivered_customer_date')
         revenue_by_month['year'] = revenue_by_month['order_delivered_customer_date'].dt.year
         revenue_by_month['month'] = revenue_by_month['order_delivered_customer_date'].dt.month
@@ -41,94 +63,173 @@ class DataAnalysis:
         }, inplace=True)
         return count_order_by_month
     
+    @instrumented()
     def create_mean_delivery_time_df(self):
+        if self.rollup is not None:
+            return self.rollup.create_mean_delivery_time_df()
         new_orders_data = self.df.dropna(subset='order_delivered_customer_date')
         new_orders_data['day_difference'] = (new_orders_data['order_delivered_customer_date'] - new_orders_data['order_purchase_timestamp']) / np.timedelta64(1, 'D')
-        mean_day_diff = new_orders_data.groupby('seller_id').mean(numeric_only=True)['day_difference'].reset_index().sort_values('day_difference', ascending=True)
+        mean_day_diff = new_orders_data.groupby('seller_id', observed=True).mean(numeric_only=True)['day_difference'].reset_index().sort_values('day_difference', ascending=True)
         mean_day_diff['day_difference'] = mean_day_diff['day_difference'].round(2)
         return mean_day_diff
     
+    @instrumented()
     def create_mean_estimated_diff_df(self):
+        if self.rollup is not None:
+            return self.rollup.create_mean_estimated_diff_df()
         new_orders_data = self.df.dropna(subset='order_delivered_customer_date')
         new_orders_data['day_estimated_difference'] = (new_orders_data['order_estimated_delivery_date'] - new_orders_data['order_delivered_customer_date']) / np.timedelta64(1, 'D')
-        mean_day_est_diff = new_orders_data.groupby('seller_id').mean(numeric_only=True)['day_estimated_difference'].reset_index().sort_values('day_estimated_difference', ascending=False)
+        mean_day_est_diff = new_orders_data.groupby('seller_id', observed=True).mean(numeric_only=True)['day_estimated_difference'].reset_index().sort_values('day_estimated_difference', ascending=False)
         mean_day_est_diff['day_estimated_difference'] = mean_day_est_diff['day_estimated_difference'].round(2)
         return mean_day_est_diff
     
+    @instrumented()
     def create_review_df(self):
+        if self.rollup is not None:
+            return self.rollup.create_review_df()
         count_rating = self.df.groupby('review_score').count()['order_id'].reset_index().sort_values('order_id', ascending=False)
         count_rating.rename(columns={
             'order_id': 'rating_count'
         }, inplace=True)
         return count_rating
     
+    @instrumented()
     def create_rfm_df(self):
-        new_cust_data = self.df.dropna(subset='order_delivered_customer_date')[['customer_id',
-                                                                           'order_estimated_delivery_date',
-                                                                           'payment_value_y']].sort_values(['customer_id', 'order_estimated_delivery_date'])
-
-        new_cust_data['recency'] = (pd.to_datetime('today') - new_cust_data['order_estimated_delivery_date']).dt.days
-        frequency_data = self.df.groupby('customer_id')['order_id'].count().reset_index()
-        frequency_data.rename(columns= {'order_id': 'frequency'}, inplace = True)
-        new_cust_data = new_cust_data.merge(frequency_data, on = 'customer_id', how = 'left')
-        recency_scores = [5, 4, 3, 2, 1]
-        frequency_scores = [1, 2, 3, 4, 5]
-        monetary_scores = [1, 2, 3, 4, 5]
-
-        new_cust_data['recency_score'] = pd.cut(new_cust_data['recency'], bins = 5, labels= recency_scores)
-        new_cust_data['frequency_score'] = pd.cut(new_cust_data['frequency'], bins = 5, labels= frequency_scores)
-        new_cust_data['monetary_score'] = pd.cut(new_cust_data['payment_value_y'], bins= 5, labels= monetary_scores)
-
-        new_cust_data['recency_score'] = new_cust_data['recency_score'].astype(int)
-        new_cust_data['frequency_score'] = new_cust_data['frequency_score'].astype(int)
-        new_cust_data['monetary_score'] = new_cust_data['monetary_score'].astype(int)
-
-        new_cust_data['RFM_score'] = new_cust_data['recency_score'] + new_cust_data['frequency_score'] + new_cust_data['monetary_score']
-
-        segment_labels = ['Low-Value', 'Mid-Value', 'High-Value']
-        new_cust_data['value_segment'] = pd.qcut(new_cust_data['RFM_score'], q= 3, labels= segment_labels)
-
-        new_cust_data['RFM_customer_segments'] = ''
-
-        new_cust_data.loc[new_cust_data['RFM_score'] >= 9, 'RFM_customer_segments'] = 'Champions'
-        new_cust_data.loc[(new_cust_data['RFM_score'] >= 6) & (new_cust_data['RFM_score'] < 9), 'RFM_customer_segments'] = 'Potential Loyalists'
-        new_cust_data.loc[(new_cust_data['RFM_score'] >= 5) & (new_cust_data['RFM_score'] < 6), 'RFM_customer_segments'] = 'At-Risk Customers'
-        new_cust_data.loc[(new_cust_data['RFM_score'] >= 4) & (new_cust_data['RFM_score'] < 5), 'RFM_customer_segments'] = 'Cannot Lose'
-        new_cust_data.loc[(new_cust_data['RFM_score'] >= 3) & (new_cust_data['RFM_score'] < 4), 'RFM_customer_segments'] = 'Lost'
-
-        segment_product_counts = new_cust_data.groupby(['value_segment', 'RFM_customer_segments']).size().reset_index(name = 'count')
-        segment_product_counts = segment_product_counts.sort_values('count', ascending= False)
-        segment_product_counts = segment_product_counts[segment_product_counts['count'] > 1]
-        return new_cust_data, segment_product_counts
+        return RFMEngine(self.reference_date).score(customer_partials(self.df))
     
+    @instrumented()
+    def compute_all(self):
+        if self.rollup is not None:
+            # go through the instrumented methods so each aggregation keeps its own timing record
+            return {
+                'sum_revenue': self.create_sum_revenue_df(),
+                'sum_spend': self.create_sum_spend_df(),
+                'count_product': self.create_count_product_df(),
+                'revenue_by_month_year': self.create_revenue_by_month_year_df(),
+                'mean_delivery_time': self.create_mean_delivery_time_df(),
+                'mean_estimated_diff': self.create_mean_estimated_diff_df(),
+                'review': self.create_review_df(),
+                'rfm': self.create_rfm_df()
+            }
+
+        df = self.df
+        delivered = df['order_delivered_customer_date']
+        derived = pd.DataFrame({
+            'seller_id': df['seller_id'],
+            'revenue': df['payment_value_y'],
+            'day_difference': (delivered - df['order_purchase_timestamp']) / np.timedelta64(1, 'D'),
+            'day_estimated_difference': (df['order_estimated_delivery_date'] - delivered) / np.timedelta64(1, 'D')
+        })
+        # undelivered rows have NaN differences, which mean() skips just like the dropna in the per-method path
+        seller = derived.groupby('seller_id', observed=True).agg(
+            revenue=('revenue', 'sum'),
+            day_difference=('day_difference', 'mean'),
+            day_estimated_difference=('day_estimated_difference', 'mean')
+        ).reset_index()
+
+        mean_day_diff = seller[['seller_id', 'day_difference']].dropna(subset='day_difference').sort_values('day_difference', ascending=True)
+        mean_day_diff['day_difference'] = mean_day_diff['day_difference'].round(2)
+        mean_day_est_diff = seller[['seller_id', 'day_estimated_difference']].dropna(subset='day_estimated_difference').sort_values('day_estimated_difference', ascending=False)
+        mean_day_est_diff['day_estimated_difference'] = mean_day_est_diff['day_estimated_difference'].round(2)
+
+        count_order_by_month = df.groupby([delivered.dt.year.rename('year'), delivered.dt.month.rename('month')]).agg(
+            order_count=('order_id', 'count'),
+            revenue=('payment_value_y', 'sum')
+        ).reset_index().astype({'year': 'int32', 'month': 'int32'}).sort_values(['year', 'month'])
+
+        return {
+            'sum_revenue': seller[['seller_id', 'revenue']].sort_values('revenue', ascending=False),
+            'sum_spend': sum_spend(df),
+            'count_product': df.groupby('product_category_name_english', observed=True)['order_id'].count().reset_index(name='product_count').sort_values('product_count', ascending=False),
+            'revenue_by_month_year': count_order_by_month,
+            'mean_delivery_time': mean_day_diff,
+            'mean_estimated_diff': mean_day_est_diff,
+            'review': df.groupby('review_score')['order_id'].count().reset_index(name='rating_count').sort_values('rating_count', ascending=False),
+            'rfm': self.create_rfm_df()
+        }
+
 class GeoAnalysis:
-    def __init__(self, cust_df, sell_df):
+    DENSITY_MODES = ['points', 'hex', 'grid', 'state', 'zip', 'choropleth']
+
+    def __init__(self, cust_df, sell_df, mode='points', gridsize=200, region_level=None):
         self.cust_df = cust_df
         self.sell_df = sell_df
+        self.mode = mode
+        self.gridsize = gridsize
+        self.region_level = region_level or default_level()
+        self.bounds = data_bounds(cust_df, sell_df)
 
-    def plot_customer_geolocation(self):
-        gcdf = gpd.GeoDataFrame(
-            self.cust_df, geometry=gpd.points_from_xy(self.cust_df.geolocation_lng, self.cust_df.geolocation_lat), crs="EPSG:4326"
-        )
-        street_map = gpd.read_file('./data/ne_10m_admin_0_countries.shp')
-        fig, ax = plt.subplots(figsize=(35, 35))
+    @instrumented()
+    def customer_region_counts(self):
+        return region_counts(self.cust_df, self.region_level, self.bounds)
+
+    @instrumented(rows=lambda self: len(self.sell_df))
+    def seller_region_counts(self):
+        return region_counts(self.sell_df, self.region_level, self.bounds)
+
+    def _plot_density(self, ax, df):
+        from matplotlib.colors import LogNorm
+
+        # every branch draws a fixed number of cells/markers, whatever the number of points
+        if self.mode == 'hex':
+            x, y, counts = density_layer(df, 'hex', self.bounds, self.gridsize)
+            minx, miny, maxx, maxy = self.bounds
+            ax.hexbin(x, y, C=counts, gridsize=self.gridsize, extent=(minx, maxx, miny, maxy),
+                      reduce_C_function=np.sum, bins='log', cmap='Reds', alpha=0.8)
+        elif self.mode == 'grid':
+            xedges, yedges, counts = density_layer(df, 'grid', self.bounds, self.gridsize)
+            ax.pcolormesh(xedges, yedges, counts, norm=LogNorm(), cmap='Reds', alpha=0.8)
+        elif self.mode == 'choropleth':
+            # one polygon per region, coloured by how many points it holds
+            layer = choropleth_layer(df, self.region_level, self.bounds)
+            counts = layer['count'].dropna()
+            if counts.empty:
+                layer.plot(ax=ax, color='lightgrey', edgecolor='white', linewidth=0.5)
+                return
+            # the legend needs explicit limits; a single populated region gets a one-decade scale
+            vmin, vmax = counts.min(), counts.max()
+            norm = LogNorm(vmin=vmin, vmax=vmax) if vmax > vmin else LogNorm(vmin=vmin / 10, vmax=vmax)
+            layer.plot(ax=ax, column='count', cmap='Reds', norm=norm, edgecolor='white', linewidth=0.5,
+                       legend=True, missing_kwds={'color': 'lightgrey'})
+        else:
+            bins = density_layer(df, self.mode)
+            sizes = 5000 * bins['count'] / bins['count'].max()
+            ax.scatter(bins['geolocation_lng'], bins['geolocation_lat'], s=sizes, color='red', alpha=0.5)
+
+    def _geolocation_figure(self, df, title):
+        from charts import new_figure
+
+        street_map = load_basemap(self.bounds)
+        fig, ax = new_figure(figsize=(35, 35))
         street_map.plot(ax=ax)
         ax.axis('off')
-        gcdf.plot(ax=ax, color="red", alpha=0.2, markersize=5)
-        ax.set_title('Peta Persebaran Customer', fontsize=50)
-        st.pyplot(fig)
-        return
+        if self.mode == 'points':
+            point_layer(df).plot(ax=ax, color="red", alpha=0.2, markersize=5)
+        else:
+            self._plot_density(ax, df)
+        ax.set_xlim(self.bounds[0], self.bounds[2])
+        ax.set_ylim(self.bounds[1], self.bounds[3])
+        ax.set_title(title, fontsize=50)
+        return fig
+
+    @instrumented()
+    def customer_geolocation_figure(self):
+        return self._geolocation_figure(self.cust_df, 'Peta Persebaran Customer')
+
+    @instrumented(rows=lambda self: len(self.sell_df))
+    def seller_geolocation_figure(self):
+        return self._geolocation_figure(self.sell_df, 'Peta Persebaran Seller')
+
+    def _chart_id(self, name):
+        detail = self.region_level if self.mode == 'choropleth' else self.gridsize
+        return f'geo_{name}_{self.mode}_{detail}'
+
+    def plot_customer_geolocation(self):
+        from charts import chart_cache
+
+        return chart_cache.get(self._chart_id('customer'), [self.cust_df], self.customer_geolocation_figure)
     
     def plot_seller_geolocation(self):
-        gsdf = gpd.GeoDataFrame(
-            self.sell_df, geometry=gpd.points_from_xy(self.sell_df.geolocation_lng, self.sell_df.geolocation_lat), crs="EPSG:4326"
-        )
-        street_map = gpd.read_file('./data/ne_10m_admin_0_countries.shp')
-        fig, ax = plt.subplots(figsize=(35, 35))
-        street_map.plot(ax=ax)
-        plt.axis('off')
-        gsdf.plot(ax=ax, color="red", alpha=0.2, markersize=5)
-        ax.set_title('Peta Persebaran Seller', fontsize=50)
-        st.pyplot(fig)
-        return
-        
\ No newline at end of file
+        from charts import chart_cache
+
+        return chart_cache.get(self._chart_id('seller'), [self.sell_df], self.seller_geolocation_figure)
@@ -0,0 +1,107 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('dashboard.perf')
+
+# Streamlit runs every session's script in its own thread, so records are kept per thread
+_local = threading.local()
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is a high-water mark (KiB on Linux), the closest portable stand-in
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+
+def _records():
+    if not hasattr(_local, 'records'):
+        _local.records = []
+    return _local.records
+
+
+def start_run():
+    _local.records = []
+
+
+def records():
+    return list(_records())
+
+
+def merge_records(extra):
+    _records().extend(extra)
+
+
+def capture(func):
+    # worker threads have their own records; run func there at the caller's depth and hand its records back
+    depth = getattr(_local, 'depth', 0)
+
+    def wrapper(*args, **kwargs):
+        _local.records = []
+        _local.depth = depth
+        try:
+            return func(*args, **kwargs), list(_local.records)
+        finally:
+            _local.records = []
+            _local.depth = 0
+    return wrapper
+
+
+@contextmanager
+def timed(section, rows=None):
+    depth = getattr(_local, 'depth', 0)
+    record = {'section': section, 'rows': rows, 'depth': depth}
+    _local.depth = depth + 1
+    before = rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        _local.depth = depth
+        record['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        record['memory_delta_mb'] = round((rss_bytes() - before) / 2 ** 20, 3)
+        _records().append(record)
+        logger.info(json.dumps(record, default=str))
+
+
+def _row_count(obj):
+    for attr in ('df', 'cust_df'):
+        frame = getattr(obj, attr, None)
+        if frame is not None:
+            return len(frame)
+    return None
+
+
+def instrumented(section=None, rows=_row_count):
+    def decorator(func):
+        name = section or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with timed(name, rows(self) if rows else None):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def configure_logging(target=None):
+    target = target or os.environ.get('DASHBOARD_PERF_LOG')
+    if not target or logger.handlers:
+        return
+    handler = logging.StreamHandler() if target == '-' else logging.FileHandler(target)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
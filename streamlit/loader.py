@@ -0,0 +1,323 @@
+import hashlib
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from instrument import timed
+
+DATETIME_COLUMNS = ['order_purchase_timestamp', 'order_approved_at', 'order_delivered_carrier_date',
+                    'order_delivered_customer_date', 'order_estimated_delivery_date']
+
+ORDER_DTYPES = {
+    'order_id': 'category',
+    'customer_id': 'category',
+    'customer_unique_id': 'category',
+    'seller_id': 'category',
+    'product_id': 'category',
+    'review_id': 'category',
+    'order_status': 'category',
+    'payment_type': 'category',
+    'product_category_name': 'category',
+    'product_category_name_english': 'category',
+    'customer_city': 'category',
+    'customer_state': 'category',
+    'seller_city': 'category',
+    'seller_state': 'category',
+}
+
+GEO_DTYPES = {
+    'customer_id': 'category',
+    'customer_unique_id': 'category',
+    'seller_id': 'category',
+    'geolocation_zip_code_prefix': 'int32',
+    'geolocation_city': 'category',
+    'geolocation_state': 'category',
+    'geolocation_lat': 'float64',
+    'geolocation_lng': 'float64',
+}
+
+# the only fields the dashboard reads; compact mode skips every other column of new_all_data.csv
+COMPACT_COLUMNS = ['order_id', 'customer_id', 'seller_id', 'product_category_name_english',
+                   'payment_value_y', 'total_spend', 'review_score'] + DATETIME_COLUMNS
+
+# money stays float64 so revenue totals keep their cents
+EXACT_COLUMNS = ['payment_value_y', 'total_spend']
+
+SNAPSHOT_DIR = './data/.snapshot'
+
+_cache = {}
+_digests = {}
+_lock = threading.Lock()
+
+
+def file_digest(path):
+    stat = os.stat(path)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    cached = _digests.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    digest = sha.hexdigest()[:16]
+    _digests[path] = (stamp, digest)
+    return digest
+
+
+def _header(path):
+    return pd.read_csv(path, nrows=0).columns
+
+
+def _snapshot_path(path, digest, variant):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(SNAPSHOT_DIR, f'{name}-{digest}-{variant}.parquet')
+
+
+def evict_stale_snapshots(name, suffix, current):
+    # earlier versions of the same source: the 16-char digest between name and suffix differs
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+    for entry in os.listdir(SNAPSHOT_DIR):
+        digest = entry[len(name) + 1:-len(suffix)]
+        if entry == current or not (entry.startswith(f'{name}-') and entry.endswith(suffix) and len(digest) == 16):
+            continue
+        stale = os.path.join(SNAPSHOT_DIR, entry)
+        if os.path.isdir(stale):
+            shutil.rmtree(stale, ignore_errors=True)
+        else:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def _read_snapshot(snapshot):
+    if not os.path.exists(snapshot):
+        return None
+    try:
+        return pd.read_parquet(snapshot)
+    except (ImportError, OSError, ValueError):
+        return None
+
+
+def _write_snapshot(df, snapshot):
+    try:
+        os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+        tmp = snapshot + '.tmp'
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, snapshot)
+    except (ImportError, OSError, ValueError):
+        # pyarrow is optional; without it we simply parse the CSV every cold start
+        pass
+
+
+def load_order_batch(path, usecols=None):
+    columns = [col for col in _header(path) if usecols is None or col in usecols]
+    dtypes = {col: dtype for col, dtype in ORDER_DTYPES.items() if col in columns}
+    dates = [col for col in DATETIME_COLUMNS if col in columns]
+    df = pd.read_csv(path, usecols=columns, dtype=dtypes, parse_dates=dates)
+    return df.sort_values(by=dates, kind='mergesort', ignore_index=True)
+
+
+def compact_frame(df):
+    downcast = {}
+    for col in df.columns:
+        values = df[col]
+        if col in EXACT_COLUMNS or not pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype):
+            continue
+        if values.notna().all() and (values % 1 == 0).all():
+            downcast[col] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values.dtype):
+            downcast[col] = pd.to_numeric(values, downcast='float')
+    return df.assign(**downcast)
+
+
+def _fits(values, dtype):
+    if not pd.api.types.is_integer_dtype(dtype):
+        return True
+    if not pd.api.types.is_numeric_dtype(values.dtype) or values.isna().any():
+        return False
+    info = np.iinfo(dtype)
+    return values.empty or (info.min <= values.min() and values.max() <= info.max and (values % 1 == 0).all())
+
+
+def conform_batch(batch, like):
+    batch = batch[[col for col in like.columns if col in batch.columns]]
+    # a batch that does not fit a compacted integer column (missing or larger values) keeps its own dtype,
+    # concat then widens the store column instead of failing or wrapping around
+    dtypes = {col: like[col].dtype for col in batch.columns
+              if not isinstance(like[col].dtype, pd.CategoricalDtype) and batch[col].dtype != like[col].dtype
+              and _fits(batch[col], like[col].dtype)}
+    return batch.astype(dtypes)
+
+
+def categorical_dtypes(*frames):
+    dtypes = {}
+    for frame in frames:
+        for col in frame.columns:
+            if isinstance(frame[col].dtype, pd.CategoricalDtype):
+                dtypes.setdefault(col, frame[col].dtype)
+    return dtypes
+
+
+def extend_dtypes(dtypes, batch):
+    # new values are appended after the existing categories, so codes under the old dtypes stay valid
+    # under the new ones; the category tables are hashed once here, not in every concat
+    extended = {}
+    for col, dtype in dtypes.items():
+        extended[col] = dtype
+        if col not in batch.columns:
+            continue
+        values = pd.Index(pd.unique(batch[col].dropna().astype(object)))
+        new = values[dtype.categories.get_indexer(values) == -1]
+        if len(new):
+            extended[col] = pd.CategoricalDtype(dtype.categories.append(new))
+    return extended
+
+
+def recode(batch, dtypes):
+    # small frames only: builds codes by looking every value up in the (large) category table
+    recoded = {col: pd.Categorical(batch[col], dtype=dtype) for col, dtype in dtypes.items()
+               if col in batch.columns and batch[col].dtype is not dtype}
+    return batch.assign(**recoded)
+
+
+def _codes_under(values, dtype):
+    # frames coded under an earlier dtype of the same extend_dtypes chain keep their codes as they are
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        current = values.cat.categories
+        size = len(current)
+        if size <= len(dtype.categories) and (size == 0 or current[-1] == dtype.categories[size - 1]):
+            return values.cat.codes.to_numpy()
+    return pd.Categorical(values, dtype=dtype).codes
+
+
+def concat_coded(frames, dtypes):
+    # pd.concat hashes the whole category table of every categorical it compares, so the codes are
+    # concatenated directly instead; the cost follows the rows in the frames, not the number of categories
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    columns = list(frames[0].columns)
+    coded = [col for col in columns if col in dtypes]
+    df = pd.concat([frame.drop(columns=coded) for frame in frames], ignore_index=True)
+    for col in coded:
+        codes = np.concatenate([_codes_under(frame[col], dtypes[col]) for frame in frames])
+        df[col] = pd.Categorical.from_codes(codes, dtype=dtypes[col])
+    return df[columns]
+
+
+def code_keys(df, keys):
+    # categorical keys are grouped on their integer codes: observed=True still walks the whole category
+    # table, which for ids grows with the dataset instead of the window
+    categories = {}
+    coded = {}
+    for key in keys:
+        if isinstance(df[key].dtype, pd.CategoricalDtype):
+            categories[key] = df[key].cat.categories
+            coded[key] = df[key].cat.codes.to_numpy()
+    if not coded:
+        return df, categories
+    df = df.assign(**coded)
+    missing = np.zeros(len(df), dtype=bool)
+    for key in coded:
+        missing |= coded[key] < 0
+    # code -1 is a missing key, which groupby would otherwise keep as a group
+    return (df[~missing] if missing.any() else df), categories
+
+
+def decode_keys(df, categories):
+    return df.assign(**{key: values.take(df[key].to_numpy()) for key, values in categories.items()})
+
+
+def memory_report(df):
+    usage = df.memory_usage(deep=True, index=True)
+    return {
+        'rows': len(df),
+        'columns': len(df.columns),
+        'total_mb': round(usage.sum() / 2 ** 20, 2),
+        'per_column_mb': {col: round(value / 2 ** 20, 2) for col, value in usage.items()},
+    }
+
+
+def concat_frames(frames):
+    # align categoricals on the union of their categories so concat does not fall back to object;
+    # existing categories keep their position, so the codes of the first frame stay valid
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    first = frames[0]
+    aligned = list(frames)
+    for col in first.columns:
+        if not isinstance(first[col].dtype, pd.CategoricalDtype):
+            continue
+        categories = first[col].cat.categories
+        for frame in frames[1:]:
+            if col in frame:
+                values = frame[col]
+                extra = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else pd.Index(values.dropna().unique())
+                categories = categories.append(extra.difference(categories))
+        dtype = pd.CategoricalDtype(categories)
+        aligned = [frame.astype({col: dtype}) if col in frame and frame[col].dtype != dtype else frame for frame in aligned]
+    return pd.concat(aligned, ignore_index=True)
+
+
+def _parse_orders(path):
+    df = load_order_batch(path)
+    df.reset_index(inplace=True)
+    return df
+
+
+def _parse_orders_compact(path):
+    return compact_frame(load_order_batch(path, usecols=COMPACT_COLUMNS))
+
+
+def _parse_geo(path):
+    columns = _header(path)
+    dtypes = {col: dtype for col, dtype in GEO_DTYPES.items() if col in columns}
+    return pd.read_csv(path, dtype=dtypes)
+
+
+def _load(path, parse):
+    digest = file_digest(path)
+    variant = parse.__name__.lstrip('_')
+    key = (os.path.abspath(path), variant)
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        snapshot = _snapshot_path(path, digest, variant)
+        with timed(f'load.snapshot {os.path.basename(path)}') as record:
+            df = _read_snapshot(snapshot)
+            record['rows'] = None if df is None else len(df)
+        if df is None:
+            with timed(f'load.parse_csv {os.path.basename(path)}') as record:
+                df = parse(path)
+                record['rows'] = len(df)
+            _write_snapshot(df, snapshot)
+            # the source changed, its previous snapshots would only fill the disk
+            evict_stale_snapshots(os.path.splitext(os.path.basename(path))[0], f'-{variant}.parquet',
+                                  os.path.basename(snapshot))
+        _cache[key] = (digest, df)
+        return df
+
+
+def load_all_data(path='./data/new_all_data.csv', compact=False):
+    return _load(path, _parse_orders_compact if compact else _parse_orders)
+
+
+def load_geo_data(path):
+    return _load(path, _parse_geo)
+
+
+def evict(path):
+    key = os.path.abspath(path)
+    with _lock:
+        for cached in [cached for cached in _cache if cached[0] == key]:
+            del _cache[cached]
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+        _digests.clear()
@@ -0,0 +1,65 @@
+import os
+import threading
+from loader import compact_frame, conform_batch, extend_dtypes, file_digest, load_order_batch, recode
+from rollup import load_rollup
+from shared import shared_orders
+from store import TimeIndexedStore
+
+BATCH_DIR = './data/new_orders'
+
+
+class OrderFeed:
+    def __init__(self, path='./data/new_all_data.csv', compact=True):
+        self.path = path
+        self.compact = compact
+        self.digest = file_digest(path)
+        self.store = TimeIndexedStore(shared_orders(path, compact))
+        self.rollup = load_rollup(path)
+        self.applied = set()
+        self._lock = threading.RLock()
+
+    def append(self, batch):
+        if batch.empty:
+            return
+        if self.compact:
+            batch = compact_frame(batch)
+        with self._lock:
+            batch = conform_batch(batch, self.store.base)
+            # extend the category tables once and recode only the batch; store and cube share the result
+            dtypes = extend_dtypes(self.store.dtypes, batch)
+            batch = recode(batch, dtypes)
+            # build the new store and cube first, then swap them in so readers keep using complete ones
+            store = self.store.append(batch, dtypes)
+            rollup = self.rollup.append(batch, dtypes)
+            self.store, self.rollup = store, rollup
+
+    def snapshot(self):
+        # store and rollup are swapped together under the lock, read them together too
+        with self._lock:
+            return self.store, self.rollup
+
+    def refresh(self, directory=BATCH_DIR):
+        if not os.path.isdir(directory):
+            return []
+        with self._lock:
+            pending = sorted(name for name in os.listdir(directory)
+                             if name.endswith('.csv') and name not in self.applied)
+            for name in pending:
+                self.append(load_order_batch(os.path.join(directory, name)))
+                self.applied.add(name)
+        return pending
+
+
+_feeds = {}
+_lock = threading.Lock()
+
+
+def order_feed(path='./data/new_all_data.csv', compact=True):
+    key = (os.path.abspath(path), compact)
+    with _lock:
+        feed = _feeds.get(key)
+        # a rewritten base file means a full reload; new orders should land in BATCH_DIR instead
+        if feed is None or feed.digest != file_digest(path):
+            feed = OrderFeed(path, compact)
+            _feeds[key] = feed
+        return feed
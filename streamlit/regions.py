@@ -0,0 +1,113 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from instrument import timed
+from density import zip_prefix_bins
+from geo_cache import BASEMAP_PATH
+
+# level -> (shapefile, column holding the region name); the states layer is optional
+REGION_LAYERS = {
+    'country': (BASEMAP_PATH, 'ADMIN'),
+    'state': ('./data/ne_10m_admin_1_states_provinces.shp', 'name'),
+}
+
+_indexes = {}
+_zip_tables = {}
+_lock = threading.Lock()
+
+
+def available_levels():
+    return [level for level, (path, _) in REGION_LAYERS.items() if os.path.exists(path)]
+
+
+def default_level():
+    levels = available_levels()
+    return 'state' if 'state' in levels else 'country'
+
+
+def _index_key(level, bounds):
+    return level, tuple(round(float(v), 2) for v in bounds)
+
+
+def region_index(level, bounds, pixels=3500):
+    key = _index_key(level, bounds)
+    with _lock:
+        cached = _indexes.get(key)
+        if cached is not None:
+            return cached
+        import geopandas as gpd
+        from shapely import STRtree
+
+        path, name_column = REGION_LAYERS[level]
+        with timed(f'regions.build_index.{level}') as record:
+            regions = gpd.read_file(path, bbox=key[1])
+            regions = regions[[name_column, 'geometry']].rename(columns={name_column: 'region'})
+            regions = regions.dissolve('region', as_index=False)
+            # the tree keeps the full-detail polygons, only the drawn copy is simplified to the pixel size
+            tree = STRtree(regions.geometry.values)
+            tolerance = (key[1][2] - key[1][0]) / pixels
+            shapes = regions.set_geometry(regions.geometry.simplify(tolerance, preserve_topology=True))
+            record['rows'] = len(regions)
+        _indexes[key] = (regions, tree, shapes)
+        return _indexes[key]
+
+
+def locate(lng, lat, level, bounds):
+    import shapely
+
+    regions, tree, _ = region_index(level, bounds)
+    points = shapely.points(np.asarray(lng), np.asarray(lat))
+    found = np.full(len(points), None, dtype=object)
+    point_idx, region_idx = tree.query(points, predicate='intersects')
+    # a point on a shared border matches both regions, the first one wins
+    point_idx, first = np.unique(point_idx, return_index=True)
+    found[point_idx] = regions['region'].to_numpy()[region_idx[first]]
+    return found
+
+
+def zip_table(df, level, bounds):
+    key = _index_key(level, bounds)
+    with _lock:
+        table = _zip_tables.get(key)
+    missing = df if table is None else df[~df['geolocation_zip_code_prefix'].isin(table.index)]
+    if len(missing):
+        # a zip prefix covers a small area, so its mean position stands in for all its points
+        centroids = zip_prefix_bins(missing)
+        found = pd.Series(locate(centroids['geolocation_lng'], centroids['geolocation_lat'], level, bounds),
+                          index=centroids['geolocation_zip_code_prefix'].to_numpy())
+        with _lock:
+            cached = _zip_tables.get(key)
+            # concat only onto an existing table, an empty placeholder makes pandas warn about its dtype
+            table = found if cached is None else pd.concat([cached, found])
+            table = table[~table.index.duplicated()]
+            _zip_tables[key] = table
+    return table
+
+
+def assign_regions(df, level, bounds):
+    with timed(f'regions.assign.{level}', len(df)):
+        table = zip_table(df, level, bounds)
+        regions = df['geolocation_zip_code_prefix'].map(table)
+        # centroids that fell outside every polygon (coastal prefixes) are resolved point by point
+        unresolved = regions.isna().to_numpy()
+        if unresolved.any():
+            rows = df[unresolved]
+            regions.loc[unresolved] = locate(rows['geolocation_lng'], rows['geolocation_lat'], level, bounds)
+        return regions
+
+
+def region_counts(df, level, bounds):
+    counts = assign_regions(df, level, bounds).value_counts().rename_axis('region').reset_index(name='count')
+    return counts.sort_values('count', ascending=False, ignore_index=True)
+
+
+def choropleth_layer(df, level, bounds):
+    _, _, shapes = region_index(level, bounds)
+    return shapes.merge(region_counts(df, level, bounds), on='region', how='left')
+
+
+def clear_cache():
+    with _lock:
+        _indexes.clear()
+        _zip_tables.clear()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import pandas as pd
+from helper import DataAnalysis, GeoAnalysis
+from instrument import timed
+from loader import file_digest
+from rollup import load_rollup
+from shared import shared_geo, shared_orders
+from store import TimeIndexedStore
+
+REPORT_DIR = './data/reports'
+
+
+def parse_range(text):
+    start, end = text.split(':')
+    return pd.Timestamp(start).date(), pd.Timestamp(end).date()
+
+
+def range_dir(out_dir, start, end):
+    return os.path.join(out_dir, f'{start:%Y%m%d}-{end:%Y%m%d}')
+
+
+def write_results(results, directory):
+    os.makedirs(directory, exist_ok=True)
+    for name, frame in results.items():
+        if name == 'rfm':
+            cust_df, segment_product_df = frame
+            cust_df.to_parquet(os.path.join(directory, 'rfm_customers.parquet'), index=False)
+            segment_product_df.to_parquet(os.path.join(directory, 'rfm_segments.parquet'), index=False)
+        else:
+            frame.to_parquet(os.path.join(directory, f'{name}.parquet'), index=False)
+
+
+def write_png(path, png):
+    # takes the finished bytes, so a render that fails never leaves an empty image behind
+    with open(path, 'wb') as f:
+        f.write(png)
+
+
+def write_figures(results, directory):
+    from charts import chart_jobs, figure_png
+
+    for chart_id, (_, render) in chart_jobs(results).items():
+        write_png(os.path.join(directory, f'{chart_id}.png'), figure_png(render()))
+
+
+def load_report(start, end, digest, out_dir=REPORT_DIR):
+    directory = range_dir(out_dir, start, end)
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # a report built from another version of the source file is stale
+    if manifest.get('digest') != digest:
+        return None
+    results = {}
+    for name in manifest['results']:
+        if name == 'rfm':
+            results[name] = (pd.read_parquet(os.path.join(directory, 'rfm_customers.parquet')),
+                             pd.read_parquet(os.path.join(directory, 'rfm_segments.parquet')))
+        else:
+            results[name] = pd.read_parquet(os.path.join(directory, f'{name}.parquet'))
+    return results
+
+
+def report_figure(start, end, chart_id, out_dir=REPORT_DIR):
+    path = os.path.join(range_dir(out_dir, start, end), f'{chart_id}.png')
+    return path if os.path.exists(path) else None
+
+
+def run_stream(ranges, data, out_dir=REPORT_DIR, figures=True, chunksize=500000):
+    from streaming import StreamingAnalysis, column_max
+
+    # a hive-partitioned Parquet directory has no single file to hash, its reports are never served to the dashboard
+    digest = file_digest(data) if os.path.isfile(data) else None
+    reference_date = column_max(data, 'order_estimated_delivery_date', chunksize)
+    for start, end in ranges:
+        directory = range_dir(out_dir, start, end)
+        # every range is a separate pass over the source, memory follows the chunk size and the number of ids
+        with timed('report.range_stream') as record:
+            analysis = StreamingAnalysis(data, start, end, chunksize=chunksize, reference_date=reference_date)
+            results = analysis.compute_all()
+            record['rows'] = analysis.rows
+            write_results(results, directory)
+            if figures:
+                write_figures(results, directory)
+        with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+            json.dump({'digest': digest, 'start': str(start), 'end': str(end), 'results': list(results)}, f)
+        print(f'{start} - {end}: {analysis.rows} orders (streamed) -> {directory}', flush=True)
+
+
+def run(ranges, data='./data/new_all_data.csv', out_dir=REPORT_DIR, figures=True):
+    digest = file_digest(data)
+    # parse, index and roll up the orders once, every range is then a slice of the same store and cube
+    store = TimeIndexedStore(shared_orders(data))
+    cube = load_rollup(data)
+    reference_date = store.column_max('order_estimated_delivery_date')
+    for start, end in ranges:
+        directory = range_dir(out_dir, start, end)
+        with timed('report.range', len(store)):
+            window = store.slice(start, end)
+            results = DataAnalysis(window, rollup=cube.window(start, end), reference_date=reference_date).compute_all()
+            write_results(results, directory)
+            if figures:
+                write_figures(results, directory)
+        # written last, so an interrupted run never leaves a report the dashboard would serve
+        with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+            json.dump({'digest': digest, 'start': str(start), 'end': str(end), 'results': list(results)}, f)
+        print(f'{start} - {end}: {len(window)} orders -> {directory}', flush=True)
+
+
+def run_geo(cust_path, sell_path, modes, out_dir=REPORT_DIR):
+    from charts import figure_png
+
+    cust_df = shared_geo(cust_path)
+    sell_df = shared_geo(sell_path)
+    os.makedirs(out_dir, exist_ok=True)
+    for mode in modes:
+        plot_func = GeoAnalysis(cust_df, sell_df, mode=mode)
+        for name, figure in [('customer', plot_func.customer_geolocation_figure), ('seller', plot_func.seller_geolocation_figure)]:
+            path = os.path.join(out_dir, f'geo_{name}_{mode}.png')
+            write_png(path, figure_png(figure()))
+            print(f'{name} geolocation ({mode}) -> {path}', flush=True)
+        if mode == 'choropleth':
+            plot_func.customer_region_counts().to_parquet(os.path.join(out_dir, 'regions_customer.parquet'), index=False)
+            plot_func.seller_region_counts().to_parquet(os.path.join(out_dir, 'regions_seller.parquet'), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the dashboard tables and charts for fixed date ranges.')
+    parser.add_argument('--range', dest='ranges', type=parse_range, action='append', default=[],
+                        help='START:END, e.g. 2017-01-01:2017-12-31; repeat for more ranges')
+    parser.add_argument('--data', default='./data/new_all_data.csv')
+    parser.add_argument('--out', default=REPORT_DIR)
+    parser.add_argument('--no-figures', action='store_true', help='write the tables only')
+    parser.add_argument('--stream', action='store_true',
+                        help='aggregate --data chunk by chunk instead of loading it; --data may be a CSV or a '
+                             'month-partitioned Parquet directory')
+    parser.add_argument('--chunksize', type=int, default=500000, help='rows per chunk with --stream')
+    parser.add_argument('--geo', nargs='*', choices=GeoAnalysis.DENSITY_MODES,
+                        help='also render the geolocation maps in these modes')
+    parser.add_argument('--geo-cust', default='./data/geo_cust_data.csv')
+    parser.add_argument('--geo-sell', default='./data/geo_sell_data.csv')
+    args = parser.parse_args()
+
+    if not args.ranges and args.geo is None:
+        parser.error('nothing to do, pass --range and/or --geo')
+    if args.ranges and args.stream:
+        run_stream(args.ranges, args.data, args.out, figures=not args.no_figures, chunksize=args.chunksize)
+    elif args.ranges:
+        run(args.ranges, args.data, args.out, figures=not args.no_figures)
+    if args.geo is not None:
+        run_geo(args.geo_cust, args.geo_sell, args.geo or ['hex'], args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+from loader import code_keys, concat_frames, decode_keys
+
+SCORE_BINS = 5
+VALUE_SEGMENTS = ['Low-Value', 'Mid-Value', 'High-Value']
+CUSTOMER_SEGMENTS = [
+    (9, 'Champions'),
+    (6, 'Potential Loyalists'),
+    (5, 'At-Risk Customers'),
+    (4, 'Cannot Lose'),
+    (3, 'Lost'),
+]
+
+PARTIAL_AGGS = {
+    'last_estimated': 'max',
+    'frequency': 'sum',
+    'payment_value_y': 'sum',
+    'delivered': 'sum',
+}
+
+
+def customer_partials(df):
+    delivered = df['order_delivered_customer_date'].notna()
+    rows = pd.DataFrame({
+        'customer_id': df['customer_id'],
+        'last_estimated': df['order_estimated_delivery_date'].where(delivered),
+        'frequency': df['order_id'].notna().astype('int64'),
+        'payment_value_y': df['payment_value_y'].where(delivered),
+        'delivered': delivered.astype('int64')
+    })
+    rows, categories = code_keys(rows, ['customer_id'])
+    return decode_keys(rows.groupby('customer_id').agg(PARTIAL_AGGS).reset_index(), categories)
+
+
+def merge_partials(partials):
+    combined, categories = code_keys(concat_frames(list(partials)), ['customer_id'])
+    return decode_keys(combined.groupby('customer_id').agg(PARTIAL_AGGS).reset_index(), categories)
+
+
+def quantile_edges(values, bins=SCORE_BINS):
+    return np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])
+
+
+def bin_index(values, edges):
+    # right-closed bins like pd.qcut: a value equal to an edge falls in the lower bin
+    return np.searchsorted(edges, values, side='left')
+
+
+class RFMEngine:
+    def __init__(self, reference_date=None, edges=None):
+        self.reference_date = reference_date
+        self.edges = edges
+
+    def fit_chunks(self, chunks):
+        partial = None
+        for chunk in chunks:
+            current = customer_partials(chunk)
+            partial = current if partial is None else merge_partials([partial, current])
+        return self.score(partial)
+
+    def score(self, partial):
+        if partial is None:
+            return self._empty()
+        customers = partial[(partial['delivered'] > 0) & partial['last_estimated'].notna()]
+        if customers.empty:
+            return self._empty()
+
+        reference = self.reference_date
+        if reference is None:
+            reference = customers['last_estimated'].max()
+        reference = pd.Timestamp(reference).to_datetime64()
+        recency = np.floor((reference - customers['last_estimated'].to_numpy()) / np.timedelta64(1, 'D')).astype('int64')
+        frequency = customers['frequency'].to_numpy()
+        monetary = customers['payment_value_y'].to_numpy()
+
+        edges = self.edges or {
+            'recency': quantile_edges(recency),
+            'frequency': quantile_edges(frequency),
+            'monetary': quantile_edges(monetary)
+        }
+        recency_score = SCORE_BINS - bin_index(recency, edges['recency'])
+        frequency_score = bin_index(frequency, edges['frequency']) + 1
+        monetary_score = bin_index(monetary, edges['monetary']) + 1
+        rfm_score = recency_score + frequency_score + monetary_score
+
+        value_edges = np.quantile(rfm_score, [1 / 3, 2 / 3])
+        value_segment = pd.Categorical.from_codes(bin_index(rfm_score, value_edges), VALUE_SEGMENTS)
+        customer_segment = np.select([rfm_score >= threshold for threshold, _ in CUSTOMER_SEGMENTS],
+                                     [label for _, label in CUSTOMER_SEGMENTS], default='')
+
+        cust_df = pd.DataFrame({
+            'customer_id': customers['customer_id'].reset_index(drop=True),
+            'order_estimated_delivery_date': customers['last_estimated'].to_numpy(),
+            'payment_value_y': monetary,
+            'recency': recency,
+            'frequency': frequency,
+            'recency_score': recency_score.astype('int8'),
+            'frequency_score': frequency_score.astype('int8'),
+            'monetary_score': monetary_score.astype('int8'),
+            'RFM_score': rfm_score.astype('int8'),
+            'value_segment': value_segment,
+            'RFM_customer_segments': customer_segment
+        })
+        return cust_df, self.segment_counts(cust_df)
+
+    @staticmethod
+    def segment_counts(cust_df):
+        segment_product_counts = cust_df.groupby(['value_segment', 'RFM_customer_segments'], observed=True).size().reset_index(name='count')
+        segment_product_counts = segment_product_counts.sort_values('count', ascending=False)
+        return segment_product_counts[segment_product_counts['count'] > 1]
+
+    def _empty(self):
+        cust_df = pd.DataFrame({
+            'customer_id': pd.Series(dtype='object'),
+            'value_segment': pd.Categorical([], categories=VALUE_SEGMENTS),
+            'RFM_customer_segments': pd.Series(dtype='object')
+        })
+        return cust_df, self.segment_counts(cust_df)
@@ -0,0 +1,190 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from loader import (SNAPSHOT_DIR, categorical_dtypes, code_keys, concat_coded, concat_frames, decode_keys,
+                    evict_stale_snapshots, extend_dtypes, file_digest, recode)
+from shared import shared_orders
+from store import MAX_SEGMENTS
+
+# table name -> (group keys, {output column: (source column, aggregation)})
+ROLLUP_SPEC = {
+    'seller': (['seller_id'], {
+        'revenue': ('payment_value_y', 'sum'),
+        'delivery_days': ('day_difference', 'sum'),
+        'delivery_count': ('day_difference', 'count'),
+        'estimated_days': ('day_estimated_difference', 'sum'),
+        'estimated_count': ('day_estimated_difference', 'count'),
+    }),
+    'customer': (['customer_id'], {'total_spend': ('total_spend', 'sum')}),
+    'category': (['product_category_name_english'], {'product_count': ('order_id', 'count')}),
+    'review': (['review_score'], {'rating_count': ('order_id', 'count')}),
+    'month': (['year', 'month'], {'order_count': ('order_id', 'count'), 'revenue': ('payment_value_y', 'sum')}),
+}
+
+
+def _with_day(df, time_column):
+    delivered = df['order_delivered_customer_date']
+    # means are kept as sum/count pairs so partials from different days and batches stay mergeable
+    return df.assign(
+        day=df[time_column].dt.normalize(),
+        year=delivered.dt.year,
+        month=delivered.dt.month,
+        day_difference=(delivered - df['order_purchase_timestamp']) / np.timedelta64(1, 'D'),
+        day_estimated_difference=(df['order_estimated_delivery_date'] - delivered) / np.timedelta64(1, 'D')
+    )
+
+
+def build_tables(df, time_column='order_purchase_timestamp', by_day=True):
+    rows = _with_day(df, time_column)
+    prefix = ['day'] if by_day else []
+    tables = {}
+    for name, (keys, aggs) in ROLLUP_SPEC.items():
+        # groupby drops NaN keys, so the month table only sees delivered orders like the raw path
+        table = rows.groupby(prefix + keys, observed=True).agg(**aggs).reset_index()
+        tables[name] = table
+    tables['month'] = tables['month'].astype({'year': 'int32', 'month': 'int32'})
+    return tables
+
+
+def merge_tables(partials, by_day=False, dtypes=None):
+    prefix = ['day'] if by_day else []
+    tables = {}
+    for name, (keys, aggs) in ROLLUP_SPEC.items():
+        parts = [partial[name] for partial in partials]
+        combined = concat_frames(parts) if dtypes is None else concat_coded(parts, dtypes)
+        tables[name] = combined.groupby(prefix + keys, observed=True)[list(aggs)].sum().reset_index()
+    return tables
+
+
+class RollupCube:
+    def __init__(self, tables):
+        # the base tables plus one segment per appended batch, each ordered by day
+        self.segments = [tables]
+        self._days = [self._index_days(tables)]
+        self.dtypes = categorical_dtypes(*tables.values())
+
+    @staticmethod
+    def _index_days(tables):
+        return {name: table['day'].to_numpy(dtype='datetime64[ns]') for name, table in tables.items()}
+
+    @classmethod
+    def _from_segments(cls, segments, days, dtypes):
+        cube = cls.__new__(cls)
+        cube.segments = segments
+        cube._days = days
+        cube.dtypes = dtypes
+        return cube
+
+    @property
+    def tables(self):
+        return self.segments[0]
+
+    @classmethod
+    def from_orders(cls, df, time_column='order_purchase_timestamp'):
+        return cls(build_tables(df, time_column))
+
+    @classmethod
+    def load(cls, directory):
+        try:
+            tables = {name: pd.read_parquet(os.path.join(directory, f'{name}.parquet')) for name in ROLLUP_SPEC}
+        except (ImportError, OSError, ValueError):
+            return None
+        for name, (keys, aggs) in ROLLUP_SPEC.items():
+            if not set(['day'] + keys + list(aggs)).issubset(tables[name].columns):
+                # written by an older spec, rebuild it
+                return None
+        return cls(tables)
+
+    def save(self, directory):
+        try:
+            os.makedirs(directory, exist_ok=True)
+            for name, table in self.tables.items():
+                table.to_parquet(os.path.join(directory, f'{name}.parquet'), index=False)
+        except (ImportError, OSError, ValueError):
+            pass
+
+    def append(self, batch, dtypes=None, time_column='order_purchase_timestamp'):
+        if dtypes is None:
+            dtypes = extend_dtypes(self.dtypes, batch)
+            batch = recode(batch, dtypes)
+        # the batch becomes its own segment; overlapping days are summed when a window is read
+        segments = self.segments + [build_tables(batch, time_column)]
+        days = self._days + [self._index_days(segments[-1])]
+        if len(segments) > MAX_SEGMENTS:
+            merged = merge_tables(segments[1:], by_day=True, dtypes=dtypes)
+            segments = [segments[0], merged]
+            days = [days[0], self._index_days(merged)]
+        return RollupCube._from_segments(segments, days, dtypes)
+
+    def window(self, start, end):
+        start = pd.Timestamp(start).normalize().to_datetime64()
+        end = pd.Timestamp(end).normalize().to_datetime64()
+        tables = {}
+        for name in ROLLUP_SPEC:
+            pieces = []
+            for segment, days in zip(self.segments, self._days):
+                lo = days[name].searchsorted(start, side='left')
+                hi = days[name].searchsorted(end, side='right')
+                pieces.append(segment[name].iloc[lo:hi])
+            tables[name] = concat_coded(pieces, self.dtypes)
+        return RollupWindow(tables)
+
+
+class RollupWindow:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def _combine(self, name, columns=None):
+        keys, aggs = ROLLUP_SPEC[name]
+        table, categories = code_keys(self.tables[name], keys)
+        return decode_keys(table.groupby(keys)[columns or list(aggs)].sum().reset_index(), categories)
+
+    def _mean(self, total, count, column, ascending):
+        seller = self._combine('seller', [total, count])
+        seller = seller[seller[count] > 0]
+        mean = seller[['seller_id']].assign(**{column: (seller[total] / seller[count]).round(2)})
+        return mean.sort_values(column, ascending=ascending)
+
+    def create_sum_revenue_df(self):
+        return self._combine('seller', ['revenue']).sort_values('revenue', ascending=False)
+
+    def create_sum_spend_df(self):
+        return self._combine('customer').sort_values('total_spend', ascending=False)
+
+    def create_count_product_df(self):
+        return self._combine('category').sort_values('product_count', ascending=False)
+
+    def create_revenue_by_month_year_df(self):
+        return self._combine('month').sort_values(['year', 'month'])
+
+    def create_mean_delivery_time_df(self):
+        return self._mean('delivery_days', 'delivery_count', 'day_difference', ascending=True)
+
+    def create_mean_estimated_diff_df(self):
+        return self._mean('estimated_days', 'estimated_count', 'day_estimated_difference', ascending=False)
+
+    def create_review_df(self):
+        return self._combine('review').sort_values('rating_count', ascending=False)
+
+
+_cubes = {}
+_lock = threading.Lock()
+
+
+def load_rollup(path='./data/new_all_data.csv'):
+    digest = file_digest(path)
+    key = os.path.abspath(path)
+    with _lock:
+        cached = _cubes.get(key)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        name = os.path.splitext(os.path.basename(path))[0]
+        directory = os.path.join(SNAPSHOT_DIR, f'{name}-{digest}-rollup')
+        cube = RollupCube.load(directory)
+        if cube is None:
+            cube = RollupCube.from_orders(shared_orders(path))
+            cube.save(directory)
+            evict_stale_snapshots(name, '-rollup', os.path.basename(directory))
+        _cubes[key] = (digest, cube)
+        return cube
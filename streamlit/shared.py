@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from loader import evict, file_digest, load_all_data, load_geo_data
+
+SHARED_DIR = './data/.shared'
+
+_views = {}
+_lock = threading.Lock()
+
+
+def export_frame(df, directory):
+    tmp = f'{directory}.{os.getpid()}.tmp'
+    os.makedirs(tmp, exist_ok=True)
+    meta = {'rows': len(df), 'columns': []}
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        if values.dtype == object:
+            values = values.astype('category')
+        entry = {'name': col, 'file': f'{i}.npy'}
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            entry['kind'] = 'categorical'
+            entry['categories'] = f'{i}.categories.npy'
+            np.save(os.path.join(tmp, entry['file']), values.cat.codes.to_numpy())
+            categories = values.cat.categories.to_numpy()
+            if categories.dtype == object:
+                # fixed-width unicode keeps the lookup table loadable without pickle
+                categories = categories.astype(str)
+            np.save(os.path.join(tmp, entry['categories']), categories)
+        else:
+            entry['kind'] = 'plain'
+            np.save(os.path.join(tmp, entry['file']), values.to_numpy())
+        meta['columns'].append(entry)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    try:
+        os.rename(tmp, directory)
+    except OSError:
+        # another process exported the same snapshot first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def open_frame(directory):
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    data = {}
+    for entry in meta['columns']:
+        values = np.load(os.path.join(directory, entry['file']), mmap_mode='r')
+        if entry['kind'] == 'categorical':
+            # only the codes are shared; pandas needs Python strings for the categories, so each process
+            # decodes its own copy of the table (one string per distinct id, not per row)
+            categories = np.load(os.path.join(directory, entry['categories']))
+            if categories.dtype.kind == 'U':
+                categories = categories.astype(object)
+            values = pd.Categorical.from_codes(values, categories=categories)
+        data[entry['name']] = values
+    # copy=False keeps every column as its own read-only view of the mapped file
+    return pd.DataFrame(data, copy=False)
+
+
+def _is_stale(entry, name, variant, current):
+    return entry != current and entry.startswith(f'{name}-') and entry.endswith(f'-{variant}')
+
+
+def _evict_stale(name, variant, current):
+    for directory in [key for key in _views if _is_stale(os.path.basename(key), name, variant, current)]:
+        del _views[directory]
+    if not os.path.isdir(SHARED_DIR):
+        return
+    for entry in os.listdir(SHARED_DIR):
+        if _is_stale(entry, name, variant, current):
+            # processes still mapping the old files keep them until they unmap, unlinking is safe on POSIX
+            shutil.rmtree(os.path.join(SHARED_DIR, entry), ignore_errors=True)
+
+
+def _shared(path, variant, build):
+    digest = file_digest(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    directory = os.path.join(SHARED_DIR, f'{name}-{digest}-{variant}')
+    with _lock:
+        cached = _views.get(directory)
+        if cached is not None:
+            return cached
+        # the source file changed: drop the views and exports of its previous versions
+        _evict_stale(name, variant, os.path.basename(directory))
+        if not os.path.exists(os.path.join(directory, 'meta.json')):
+            os.makedirs(SHARED_DIR, exist_ok=True)
+            export_frame(build(), directory)
+            # drop the private parsed copy, this process reads the mapped one like every other
+            evict(path)
+        df = open_frame(directory)
+        _views[directory] = df
+        return df
+
+
+def shared_orders(path='./data/new_all_data.csv', compact=True):
+    return _shared(path, 'compact' if compact else 'full', lambda: load_all_data(path, compact))
+
+
+def shared_geo(path):
+    return _shared(path, 'geo', lambda: load_geo_data(path))
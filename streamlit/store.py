@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from loader import categorical_dtypes, concat_coded, extend_dtypes, recode
+
+# batch segments beyond this are merged into one; the base segment is never rewritten
+MAX_SEGMENTS = 16
+
+
+def _sorted_times(df, time_column):
+    times = df[time_column].to_numpy(dtype='datetime64[ns]')
+    if len(times) > 1 and (times[1:] < times[:-1]).any():
+        raise ValueError(f'{time_column} must be sorted ascending')
+    return times
+
+
+class TimeIndexedStore:
+    def __init__(self, df, time_column='order_purchase_timestamp'):
+        self.time_column = time_column
+        # the base frame (usually the shared memory-mapped one) plus one time-sorted segment per appended batch
+        self.segments = [df]
+        self._times = [_sorted_times(df, time_column)]
+        self.dtypes = categorical_dtypes(df)
+
+    @classmethod
+    def _from_segments(cls, segments, times, dtypes, time_column):
+        store = cls.__new__(cls)
+        store.time_column = time_column
+        store.segments = segments
+        store._times = times
+        store.dtypes = dtypes
+        return store
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    @property
+    def base(self):
+        return self.segments[0]
+
+    @property
+    def min_time(self):
+        return min(segment[self.time_column].iloc[0] for segment in self.segments if len(segment))
+
+    @property
+    def max_time(self):
+        return max(segment[self.time_column].iloc[-1] for segment in self.segments if len(segment))
+
+    def column_max(self, column):
+        return max(segment[column].max() for segment in self.segments if len(segment))
+
+    def bounds(self, start, end):
+        start = pd.Timestamp(start).normalize().to_datetime64()
+        # the date picker is inclusive, so keep every order placed on the end date
+        stop = (pd.Timestamp(end).normalize() + pd.Timedelta(days=1)).to_datetime64()
+        return [(np.searchsorted(times, start, side='left'), np.searchsorted(times, stop, side='left'))
+                for times in self._times]
+
+    def slice(self, start, end):
+        pieces = [segment.iloc[lo:hi] for segment, (lo, hi) in zip(self.segments, self.bounds(start, end))]
+        if len(self.segments) == 1:
+            # no batches yet: a plain view of the base frame, nothing is copied
+            return pieces[0]
+        window = concat_coded(pieces, self.dtypes)
+        if any(window is piece for piece in pieces):
+            # the range only touches one segment, which is already sorted
+            return window
+        return window.sort_values(self.time_column, kind='mergesort', ignore_index=True)
+
+    def append(self, batch, dtypes=None):
+        if dtypes is None:
+            dtypes = extend_dtypes(self.dtypes, batch)
+            batch = recode(batch, dtypes)
+        batch = batch.sort_values(self.time_column, kind='mergesort', ignore_index=True)
+        segments = self.segments + [batch]
+        times = self._times + [_sorted_times(batch, self.time_column)]
+        if len(segments) > MAX_SEGMENTS:
+            # only the batches are merged, so the cost follows the appended rows, not the whole store
+            merged = concat_coded(segments[1:], dtypes).sort_values(self.time_column, kind='mergesort', ignore_index=True)
+            segments = [segments[0], merged]
+            times = [times[0], _sorted_times(merged, self.time_column)]
+        return TimeIndexedStore._from_segments(segments, times, dtypes, self.time_column)
@@ -0,0 +1,112 @@
+import os
+import pandas as pd
+from helper import DataAnalysis
+from instrument import timed
+from loader import COMPACT_COLUMNS, DATETIME_COLUMNS, ORDER_DTYPES, compact_frame
+from rfm import RFMEngine
+from rollup import RollupWindow, build_tables, merge_tables
+
+
+def _bounds(start, end):
+    start = None if start is None else pd.Timestamp(start).normalize()
+    stop = None if end is None else pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+    return start, stop
+
+
+def _in_window(chunk, start, stop, time_column):
+    times = chunk[time_column]
+    mask = pd.Series(True, index=chunk.index)
+    if start is not None:
+        mask &= times >= start
+    if stop is not None:
+        mask &= times < stop
+    return chunk[mask]
+
+
+def _iter_csv(path, start, stop, chunksize, time_column):
+    columns = pd.read_csv(path, nrows=0).columns
+    usecols = [col for col in COMPACT_COLUMNS if col in columns]
+    dtypes = {col: dtype for col, dtype in ORDER_DTYPES.items() if col in usecols}
+    dates = [col for col in DATETIME_COLUMNS if col in usecols]
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=dtypes, parse_dates=dates, chunksize=chunksize):
+        yield _in_window(chunk, start, stop, time_column)
+
+
+def _iter_parquet(directory, start, stop, chunksize, time_column):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(directory, format='parquet', partitioning='hive')
+    condition = None
+    # the month partition key prunes whole files, the timestamp filter trims the edge months
+    if start is not None:
+        condition = (ds.field('purchase_month') >= start.strftime('%Y-%m')) & (ds.field(time_column) >= start.to_pydatetime())
+    if stop is not None:
+        upper = (ds.field('purchase_month') <= stop.strftime('%Y-%m')) & (ds.field(time_column) < stop.to_pydatetime())
+        condition = upper if condition is None else condition & upper
+    columns = [col for col in COMPACT_COLUMNS if col in dataset.schema.names]
+    # batches stop at file boundaries, so the small month files are regrouped into chunks of about chunksize rows
+    pending, rows = [], 0
+    for batch in dataset.to_batches(columns=columns, filter=condition, batch_size=chunksize):
+        pending.append(batch)
+        rows += batch.num_rows
+        if rows >= chunksize:
+            yield pa.Table.from_batches(pending).to_pandas(strings_to_categorical=True)
+            pending, rows = [], 0
+    if pending:
+        yield pa.Table.from_batches(pending).to_pandas(strings_to_categorical=True)
+
+
+def iter_orders(source, start=None, end=None, chunksize=500000, time_column='order_purchase_timestamp'):
+    start, stop = _bounds(start, end)
+    if os.path.isdir(source):
+        chunks = _iter_parquet(source, start, stop, chunksize, time_column)
+    else:
+        chunks = _iter_csv(source, start, stop, chunksize, time_column)
+    for chunk in chunks:
+        if len(chunk):
+            yield compact_frame(chunk)
+
+
+def column_max(source, column, chunksize=500000):
+    # reads the one column only, so the reference date costs a fraction of a full load
+    if os.path.isdir(source):
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        table = ds.dataset(source, format='parquet', partitioning='hive').to_table(columns=[column])
+        return pd.Timestamp(pc.max(table[column]).as_py())
+    chunks = pd.read_csv(source, usecols=[column], parse_dates=[column], chunksize=chunksize)
+    return max(chunk[column].max() for chunk in chunks)
+
+
+def write_partitioned(df, directory, time_column='order_purchase_timestamp'):
+    # plain strings, a categorical column would store its whole category table again in every month file
+    strings = {col: 'object' for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)}
+    partitioned = df.astype(strings).assign(purchase_month=df[time_column].dt.strftime('%Y-%m'))
+    partitioned.to_parquet(directory, partition_cols=['purchase_month'], index=False)
+
+
+class StreamingAnalysis(DataAnalysis):
+    def __init__(self, source, start=None, end=None, chunksize=500000, reference_date=None):
+        self.rows = 0
+        self._tables = None
+        with timed('StreamingAnalysis.scan') as record:
+            # one pass over the source: the RFM engine folds its partials while the rollup tables are merged here
+            rfm = RFMEngine(reference_date).fit_chunks(self._fold_tables(iter_orders(source, start, end, chunksize)))
+            record['rows'] = self.rows
+        if self._tables is None:
+            raise ValueError(f'no orders in {source} for the selected range')
+        super().__init__(None, rollup=RollupWindow(self._tables), reference_date=reference_date)
+        self.rfm = rfm
+
+    def _fold_tables(self, chunks):
+        for chunk in chunks:
+            self.rows += len(chunk)
+            # keep only per-key running totals, so memory follows the number of sellers/customers, not orders
+            partial = build_tables(chunk, by_day=False)
+            self._tables = partial if self._tables is None else merge_tables([self._tables, partial])
+            yield chunk
+
+    def create_rfm_df(self):
+        return self.rfm
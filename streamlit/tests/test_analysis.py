@@ -0,0 +1,49 @@
+import pytest
+from benchmark import METHODS, frames_match, make_orders
+from helper import DataAnalysis
+from loader import COMPACT_COLUMNS, compact_frame
+from rollup import RollupCube
+from store import TimeIndexedStore
+
+
+@pytest.fixture(scope='module')
+def window():
+    orders = compact_frame(make_orders(20000)[COMPACT_COLUMNS])
+    start, end = '2017-03-01', '2017-03-30'
+    return TimeIndexedStore(orders).slice(start, end), RollupCube.from_orders(orders).window(start, end)
+
+
+def test_paths_agree(window):
+    # the window keeps the full category tables; grouping on codes must only see its own customers
+    df, rollup = window
+    reference_date = df['order_estimated_delivery_date'].max()
+    per_method = DataAnalysis(df, reference_date=reference_date)
+    expected = {name: getattr(per_method, method)() for name, method in METHODS.items()}
+    fused = per_method.compute_all()
+    rolled = DataAnalysis(df, rollup=rollup, reference_date=reference_date).compute_all()
+    for name in METHODS:
+        if name == 'rfm':
+            for results in (fused, rolled):
+                assert frames_match(expected[name][0], results[name][0])
+        else:
+            assert frames_match(expected[name], fused[name]), name
+            assert frames_match(expected[name], rolled[name]), name
+    assert len(expected['sum_spend']) == df['customer_id'].nunique()
+
+
+def test_parallel_matches_local(window, monkeypatch):
+    import executor
+
+    df, rollup = window
+    reference_date = df['order_estimated_delivery_date'].max()
+    expected = DataAnalysis(df, rollup=rollup, reference_date=reference_date).compute_all()
+    monkeypatch.setattr(executor, 'PARALLEL_MIN_ROWS', 0)
+    results = executor.compute_all_parallel(df, rollup=rollup, reference_date=reference_date, workers=2)
+    executor.shutdown()
+    assert list(results) == list(expected)
+    for name in METHODS:
+        if name == 'rfm':
+            assert frames_match(expected[name][0], results[name][0])
+            assert frames_match(expected[name][1], results[name][1])
+        else:
+            assert frames_match(expected[name], results[name]), name
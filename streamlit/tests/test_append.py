@@ -0,0 +1,71 @@
+import time
+import pandas as pd
+import pytest
+from benchmark import make_orders
+from loader import COMPACT_COLUMNS, compact_frame, concat_frames, conform_batch, extend_dtypes, recode
+from rollup import RollupCube
+from store import MAX_SEGMENTS, TimeIndexedStore
+
+METHODS = ['create_sum_revenue_df', 'create_sum_spend_df', 'create_count_product_df',
+           'create_revenue_by_month_year_df', 'create_mean_delivery_time_df', 'create_mean_estimated_diff_df',
+           'create_review_df']
+
+
+def orders(n, seed=0):
+    return compact_frame(make_orders(n, seed)[COMPACT_COLUMNS])
+
+
+def normalized(df):
+    df = df.astype({col: str for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def append_all(base, batches):
+    store, cube = TimeIndexedStore(base), RollupCube.from_orders(base)
+    for batch in batches:
+        batch = conform_batch(batch, base)
+        dtypes = extend_dtypes(store.dtypes, batch)
+        batch = recode(batch, dtypes)
+        store, cube = store.append(batch, dtypes), cube.append(batch, dtypes)
+    return store, cube
+
+
+@pytest.mark.parametrize('n_batches', [1, MAX_SEGMENTS + 3])
+def test_append_matches_rebuild(n_batches):
+    base = orders(5000)
+    batches = [orders(50, seed=i + 1) for i in range(n_batches)]
+    store, cube = append_all(base, batches)
+    full = concat_frames([base] + batches).sort_values('order_purchase_timestamp', kind='mergesort', ignore_index=True)
+    rebuilt_store, rebuilt_cube = TimeIndexedStore(full), RollupCube.from_orders(full)
+
+    assert len(store.segments) <= MAX_SEGMENTS
+    assert len(store) == len(full)
+    for start, end in [('2016-01-01', '2019-12-31'), ('2017-03-01', '2017-03-31')]:
+        pd.testing.assert_frame_equal(normalized(store.slice(start, end)), normalized(rebuilt_store.slice(start, end)),
+                                      check_dtype=False)
+        window, rebuilt = cube.window(start, end), rebuilt_cube.window(start, end)
+        for method in METHODS:
+            pd.testing.assert_frame_equal(normalized(getattr(window, method)()), normalized(getattr(rebuilt, method)()),
+                                          check_dtype=False)
+
+
+def test_append_is_cheaper_than_rebuild():
+    base = orders(300000)
+    batch = orders(200, seed=7)
+    store, cube = TimeIndexedStore(base), RollupCube.from_orders(base)
+
+    start = time.perf_counter()
+    coded = conform_batch(batch, base)
+    dtypes = extend_dtypes(store.dtypes, coded)
+    coded = recode(coded, dtypes)
+    store.append(coded, dtypes)
+    cube.append(coded, dtypes)
+    appended = time.perf_counter() - start
+
+    start = time.perf_counter()
+    full = concat_frames([base, batch]).sort_values('order_purchase_timestamp', kind='mergesort', ignore_index=True)
+    TimeIndexedStore(full)
+    RollupCube.from_orders(full)
+    rebuilt = time.perf_counter() - start
+
+    assert appended < rebuilt
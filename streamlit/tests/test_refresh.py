@@ -0,0 +1,26 @@
+import os
+import numpy as np
+import pandas as pd
+from benchmark import make_orders
+from refresh import OrderFeed
+
+
+def test_refresh_widens_a_missing_review_score(tmp_path, monkeypatch):
+    # a compacted base stores a gap-free review_score as int8; a batch with a missing score must widen it, not fail
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('new_orders')
+    make_orders(1000).to_csv('orders.csv', index=False)
+    batch = make_orders(10, seed=1).astype({'review_score': 'float64'})
+    batch.loc[0, 'review_score'] = np.nan
+    batch.to_csv(os.path.join('new_orders', 'batch.csv'), index=False)
+
+    feed = OrderFeed('orders.csv')
+    assert pd.api.types.is_integer_dtype(feed.store.base['review_score'].dtype)
+    assert feed.refresh('new_orders') == ['batch.csv']
+    assert feed.refresh('new_orders') == []
+
+    store, rollup = feed.snapshot()
+    window = store.slice(store.min_time, store.max_time)
+    assert len(window) == 1010
+    assert window['review_score'].isna().sum() == 1
+    assert rollup.window(store.min_time, store.max_time).create_review_df()['rating_count'].sum() == 1009
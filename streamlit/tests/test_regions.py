@@ -0,0 +1,62 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import box
+import geo_cache
+import regions
+from benchmark import make_geo
+from charts import figure_png
+from helper import GeoAnalysis
+from instrument import records, start_run
+
+
+@pytest.fixture
+def layers(tmp_path, monkeypatch):
+    # two "states" side by side over the synthetic Brazilian points, and one country around both
+    states = gpd.GeoDataFrame({'name': ['West', 'East']}, geometry=[box(-75, -35, -45, 6), box(-45, -35, -30, 6)],
+                              crs='EPSG:4326')
+    country = gpd.GeoDataFrame({'ADMIN': ['Brazil']}, geometry=[box(-75, -35, -30, 6)], crs='EPSG:4326')
+    states_path = str(tmp_path / 'states.shp')
+    country_path = str(tmp_path / 'country.shp')
+    states.to_file(states_path)
+    country.to_file(country_path)
+    monkeypatch.setattr(geo_cache, 'BASEMAP_PATH', country_path)
+    monkeypatch.setattr(regions, 'REGION_LAYERS', {'country': (country_path, 'ADMIN'), 'state': (states_path, 'name')})
+    geo_cache.clear_cache()
+    regions.clear_cache()
+    yield
+    geo_cache.clear_cache()
+    regions.clear_cache()
+
+
+def test_region_counts_match_point_in_polygon(layers):
+    df = make_geo(2000, 'customer_id')
+    # one point per prefix, so the prefix centroid is the point itself and the shortcut must be exact
+    df['geolocation_zip_code_prefix'] = np.arange(len(df), dtype='int32')
+    bounds = geo_cache.data_bounds(df)
+    counts = regions.region_counts(df, 'state', bounds).set_index('region')['count']
+    inside = df['geolocation_lat'].between(-35, 6)
+    east = df['geolocation_lng'].between(-45, -30) & inside
+    west = df['geolocation_lng'].between(-75, -45, inclusive='left') & inside
+    assert counts.get('East', 0) == east.sum()
+    assert counts.get('West', 0) == west.sum()
+
+
+@pytest.mark.parametrize('level', ['state', 'country'])
+def test_choropleth_renders(layers, level):
+    # at country level every point is in one region, so the colour scale has vmin == vmax
+    plot_func = GeoAnalysis(make_geo(500, 'customer_id'), make_geo(50, 'seller_id', seed=1),
+                            mode='choropleth', region_level=level)
+    for figure in (plot_func.customer_geolocation_figure, plot_func.seller_geolocation_figure):
+        assert figure_png(figure()).startswith(b'\x89PNG')
+
+
+def test_seller_records_count_sellers(layers):
+    cust_df, sell_df = make_geo(500, 'customer_id'), make_geo(50, 'seller_id', seed=1)
+    plot_func = GeoAnalysis(cust_df, sell_df, mode='choropleth', region_level='state')
+    start_run()
+    plot_func.customer_region_counts()
+    plot_func.seller_region_counts()
+    rows = {record['section']: record['rows'] for record in records() if record['section'].startswith('GeoAnalysis.')}
+    assert rows == {'GeoAnalysis.customer_region_counts': len(cust_df), 'GeoAnalysis.seller_region_counts': len(sell_df)}
@@ -0,0 +1,17 @@
+from benchmark import frames_match, make_orders
+from helper import DataAnalysis
+from loader import COMPACT_COLUMNS, compact_frame
+from rfm import RFMEngine
+
+
+def test_fit_chunks_matches_whole_frame():
+    orders = compact_frame(make_orders(20000)[COMPACT_COLUMNS])
+    reference_date = orders['order_estimated_delivery_date'].max()
+    cust_df, segments = DataAnalysis(orders, reference_date=reference_date).create_rfm_df()
+    # uneven chunks, and customers with orders in more than one of them
+    bounds = [0, 1234, 7000, 7001, 15000, len(orders)]
+    chunks = (orders.iloc[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:]))
+    chunked_cust_df, chunked_segments = RFMEngine(reference_date).fit_chunks(chunks)
+    assert orders['customer_id'].duplicated().any()
+    assert frames_match(cust_df, chunked_cust_df)
+    assert frames_match(segments, chunked_segments)
@@ -0,0 +1,26 @@
+import os
+from benchmark import make_orders
+from loader import SNAPSHOT_DIR, file_digest, load_all_data
+from rollup import load_rollup
+
+
+def test_rewritten_source_evicts_old_snapshots(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    path = os.path.join('data', 'orders.csv')
+    # a different source whose name shares the prefix must survive
+    other = os.path.join('data', 'orders-2018.csv')
+    make_orders(200, seed=2).to_csv(other, index=False)
+    load_all_data(other)
+    for seed in (0, 1):
+        make_orders(500, seed).to_csv(path, index=False)
+        load_all_data(path)
+        load_all_data(path, compact=True)
+        load_rollup(path)
+    digest = file_digest(path)
+    assert sorted(os.listdir(SNAPSHOT_DIR)) == sorted([
+        f'orders-2018-{file_digest(other)}-parse_orders.parquet',
+        f'orders-{digest}-parse_orders.parquet',
+        f'orders-{digest}-parse_orders_compact.parquet',
+        f'orders-{digest}-rollup',
+    ])
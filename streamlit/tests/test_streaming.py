@@ -0,0 +1,36 @@
+import pytest
+from benchmark import METHODS, frames_match, make_orders
+from helper import DataAnalysis
+from loader import COMPACT_COLUMNS, compact_frame
+from store import TimeIndexedStore
+from streaming import StreamingAnalysis, write_partitioned
+
+START, END = '2017-03-01', '2017-05-30'
+
+
+@pytest.fixture(scope='module')
+def sources(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('orders')
+    orders = make_orders(20000)
+    orders.to_csv(tmp / 'orders.csv', index=False)
+    compact = compact_frame(orders[COMPACT_COLUMNS])
+    write_partitioned(compact, tmp / 'orders')
+    return compact, {'csv': str(tmp / 'orders.csv'), 'parquet': str(tmp / 'orders')}
+
+
+@pytest.mark.parametrize('kind', ['csv', 'parquet'])
+def test_streaming_matches_in_memory(sources, kind):
+    compact, paths = sources
+    window = TimeIndexedStore(compact).slice(START, END)
+    reference_date = window['order_estimated_delivery_date'].max()
+    expected = DataAnalysis(window, reference_date=reference_date).compute_all()
+    # a small chunk size so every table is merged across several chunks
+    streamed = StreamingAnalysis(paths[kind], START, END, chunksize=3000, reference_date=reference_date)
+    results = streamed.compute_all()
+    assert streamed.rows == len(window)
+    for name in METHODS:
+        if name == 'rfm':
+            assert frames_match(expected[name][0], results[name][0])
+            assert frames_match(expected[name][1], results[name][1])
+        else:
+            assert frames_match(expected[name], results[name]), name